@@ -0,0 +1,50 @@
+"""
+benchmark_index.py
+
+Program to measure the indexing throughput (docs/sec) of index.py with a different number of processes.
+Each configuration builds a fresh index in a temporary folder that is removed afterwards.
+Usage: python benchmark_index.py -docs <docs folder> [-procs <comma separated list, default 1,2,4,8>]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from index import MyIndex, list_docs
+
+
+def benchmark(docs_folder, procs_list):
+    num_docs = len(list_docs(docs_folder))
+    print(f'Documents: {num_docs}')
+    print('procs\tseconds\tdocs/sec')
+    for procs in procs_list:
+        index_folder = tempfile.mkdtemp(prefix='zaguan_bench_')
+        try:
+            start = time.perf_counter()
+            my_index = MyIndex(index_folder, procs=procs)
+            my_index.index_docs(docs_folder)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(index_folder, ignore_errors=True)
+        print(f'{procs}\t{elapsed:.2f}\t{num_docs / elapsed:.1f}')
+
+
+if __name__ == '__main__':
+    docs_folder = '../docs'
+    procs_list = [1, 2, 4, 8]
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-docs':
+            docs_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-procs':
+            procs_list = [int(p) for p in sys.argv[i + 1].split(',')]
+            i = i + 1
+        i = i + 1
+
+    if not os.path.exists(docs_folder):
+        print(f'Docs folder not found: {docs_folder}')
+        exit(1)
+    benchmark(docs_folder, procs_list)
@@ -0,0 +1,118 @@
+"""
+benchmark_parse.py
+
+Micro-benchmark of the XML field extraction used by index.py.
+Compares the single-walk extraction (index.parse_xml_doc) against the former method
+(nine root.findall('.//{*}...') scans) and checks that both produce identical fields.
+A streaming ET.iterparse variant is also measured for reference.
+Usage: python benchmark_parse.py -docs <docs folder> [-repeat <number of repetitions>]
+"""
+
+import os
+import sys
+import time
+
+import xml.etree.ElementTree as ET
+
+from index import parse_xml_doc, modified_time, DC_FIELDS
+
+
+def parse_xml_doc_findall(foldername, filename):
+    file_path = os.path.join(foldername, filename)
+    tree = ET.parse(file_path)
+    root = tree.getroot()
+    title = ' '.join([elem.text.strip() for elem in root.findall('.//{*}title') if elem.text])
+    type_of_work = ' '.join([elem.text.strip() for elem in root.findall('.//{*}type') if elem.text])
+    director= ' '.join([elem.text.strip() for elem in root.findall('.//{*}contributor') if elem.text])
+    author = ' '.join([elem.text.strip() for elem in root.findall('.//{*}creator') if elem.text])
+    date = ' '.join([elem.text.strip() for elem in root.findall('.//{*}date') if elem.text])
+    department = ' '.join([elem.text.strip() for elem in root.findall('.//{*}publisher') if elem.text])
+    subject = ' '.join([elem.text.strip() for elem in root.findall('.//{*}subject') if elem.text])
+    description = ' '.join([elem.text.strip() for elem in root.findall('.//{*}description') if elem.text])
+    identifier = ' '.join([elem.text.strip() for elem in root.findall('.//{*}identifier') if elem.text])
+
+    raw_text = "".join(root.itertext())
+    text = ' '.join(line.strip() for line in raw_text.splitlines() if line)
+    return dict(
+        path=filename,
+        content=text,
+        title=title,
+        type_of_work=type_of_work,
+        author=author,
+        director=director,
+        subject=subject,
+        description=description,
+        date=date,
+        department=department,
+        identifier=identifier,
+        modified=modified_time(file_path)
+    )
+
+
+def parse_xml_doc_iterparse(foldername, filename):
+    # Igual que parse_xml_doc pero en streaming: el texto de un elemento y su cola
+    # solo están completos al llegar el siguiente evento
+    file_path = os.path.join(foldername, filename)
+    values = {field: [] for field in DC_FIELDS.values()}
+    pieces = []
+    pending = None
+    depth = 0
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if pending is not None:
+            pending_elem, attr = pending
+            pieces.append(getattr(pending_elem, attr) or '')
+            if attr == 'tail':
+                pending_elem.clear()
+        if event == 'start':
+            depth += 1
+            pending = (elem, 'text')
+        else:
+            depth -= 1
+            field = DC_FIELDS.get(elem.tag.rsplit('}', 1)[-1])
+            if field and depth > 0 and elem.text:
+                values[field].append(elem.text.strip())
+            pending = (elem, 'tail') if depth > 0 else None
+
+    raw_text = "".join(pieces)
+    text = ' '.join(line.strip() for line in raw_text.splitlines() if line)
+    fields = {field: ' '.join(texts) for field, texts in values.items()}
+    return dict(path=filename, content=text, modified=modified_time(file_path), **fields)
+
+
+def time_method(method, docs_folder, files, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for file in files:
+            method(docs_folder, file)
+    return time.perf_counter() - start
+
+
+def benchmark(docs_folder, repeat):
+    files = [file for file in sorted(os.listdir(docs_folder)) if file.endswith('.xml')]
+    for file in files:
+        expected = parse_xml_doc_findall(docs_folder, file)
+        if parse_xml_doc(docs_folder, file) != expected or parse_xml_doc_iterparse(docs_folder, file) != expected:
+            print(f'Different output for {file}')
+            exit(1)
+    print(f'Documents: {len(files)} (identical output), repetitions: {repeat}')
+    print('method\tseconds\tms/doc')
+    methods = (('findall', parse_xml_doc_findall), ('iterparse', parse_xml_doc_iterparse), ('single walk', parse_xml_doc))
+    for name, method in methods:
+        elapsed = time_method(method, docs_folder, files, repeat)
+        print(f'{name}\t{elapsed:.3f}\t{1000 * elapsed / (len(files) * repeat):.3f}')
+
+
+if __name__ == '__main__':
+    docs_folder = '../dublinCore'
+    repeat = 10
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-docs':
+            docs_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-repeat':
+            repeat = int(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    benchmark(docs_folder, repeat)
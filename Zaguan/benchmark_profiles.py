@@ -0,0 +1,80 @@
+"""
+benchmark_profiles.py
+
+Program to compare the 'full' and 'compact' index profiles of index.py.
+For each profile it reports the index size, the build time, the query latency (loading the stored fields
+of the results) and the time to get the complete fields of a result (from the original file in the compact profile).
+Usage: python benchmark_profiles.py -docs <docs folder> -queries <queries file> [-limit <number of results>]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from index import MyIndex
+from search import MySearcher, percentile
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(folder, file)) for file in os.listdir(folder))
+
+
+def benchmark_profile(profile, docs_folder, queries, limit):
+    index_folder = tempfile.mkdtemp(prefix=f'zaguan_{profile}_')
+    try:
+        start = time.perf_counter()
+        my_index = MyIndex(index_folder, profile=profile)
+        my_index.index_docs(docs_folder)
+        build_time = time.perf_counter() - start
+        size = folder_size(index_folder)
+
+        searcher = MySearcher(index_folder, cache_size=0, docs_folder=docs_folder)
+        latencies = []
+        fetches = []
+        for query in queries:
+            start = time.perf_counter()
+            results = searcher.search(query, limit=limit)
+            hits = [(r.get('identifier'), r.get('title')) for r in results]
+            latencies.append((time.perf_counter() - start) * 1000)
+            if hits:
+                start = time.perf_counter()
+                searcher.document(results[0])
+                fetches.append((time.perf_counter() - start) * 1000)
+        searcher.searcher.close()
+    finally:
+        shutil.rmtree(index_folder, ignore_errors=True)
+
+    latencies.sort()
+    fetches.sort()
+    print(f'{profile}\t{size / 1024:.0f}\t{build_time:.2f}\t{percentile(latencies, 50):.2f}\t'
+          f'{percentile(latencies, 99):.2f}\t{percentile(fetches, 50):.3f}')
+
+
+if __name__ == '__main__':
+    docs_folder = '../docs'
+    queries_file = None
+    limit = 10
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-docs':
+            docs_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-queries':
+            queries_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-limit':
+            limit = int(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    if queries_file is None:
+        print('A queries file is required (-queries <queries file>)')
+        exit(1)
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    print('profile\tsize KB\tbuild s\tp50 ms\tp99 ms\tdocument ms')
+    for profile in ('full', 'compact'):
+        benchmark_profile(profile, docs_folder, queries, limit)
@@ -0,0 +1,68 @@
+"""
+benchmark_snippets.py
+
+Program to measure the cost of generating highlighted snippets for a page of results.
+It builds an index without character positions (the snippets re-tokenize the stored content) and another one
+with index.py -snippets (the snippets use the character positions stored in the postings), and reports the
+time per page of results for each of them.
+Usage: python benchmark_snippets.py -docs <docs folder> -queries <queries file> [-pagelen <results per page>]
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+
+from index import MyIndex
+from search import MySearcher, percentile
+
+
+def benchmark_snippets(docs_folder, queries, pagelen, chars):
+    index_folder = tempfile.mkdtemp(prefix='zaguan_snippets_')
+    try:
+        my_index = MyIndex(index_folder, snippets=chars)
+        my_index.index_docs(docs_folder)
+        searcher = MySearcher(index_folder, cache_size=0, snippets=True)
+        times = []
+        pinpoint = False
+        for query in queries:
+            results, hits, _ = searcher.search_page(query, 1, pagelen)
+            pinpoint = pinpoint or searcher.highlighter.can_load_chars(results, 'content')
+            start = time.perf_counter()
+            for hit in hits:
+                searcher.snippet(hit)
+            times.append((time.perf_counter() - start) * 1000)
+        searcher.searcher.close()
+    finally:
+        shutil.rmtree(index_folder, ignore_errors=True)
+    times.sort()
+    name = 'positions' if pinpoint else 'retokenize'
+    print(f'{name}\t{sum(times) / len(times):.2f}\t{percentile(times, 50):.2f}\t{percentile(times, 99):.2f}')
+
+
+if __name__ == '__main__':
+    docs_folder = '../docs'
+    queries_file = None
+    pagelen = 10
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-docs':
+            docs_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-queries':
+            queries_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-pagelen':
+            pagelen = int(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    if queries_file is None:
+        print('A queries file is required (-queries <queries file>)')
+        exit(1)
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    print('snippets\tmean ms/page\tp50 ms/page\tp99 ms/page')
+    benchmark_snippets(docs_folder, queries, pagelen, chars=False)
+    benchmark_snippets(docs_folder, queries, pagelen, chars=True)
@@ -0,0 +1,63 @@
+"""
+benchmark_stemming.py
+
+Program to measure the effect of the stem cache of spanish_analysis.SnowballFilter.
+The tokens of the documents are stemmed with a plain SnowballStemmer and with the cached filter,
+reporting the cache hit rate and the time saved per thousand documents.
+Usage: python benchmark_stemming.py -docs <docs folder> [-cachesize <number of cached forms>]
+"""
+
+import sys
+import time
+
+from whoosh.analysis import RegexTokenizer, LowercaseFilter, StopFilter
+from nltk.stem.snowball import SnowballStemmer
+
+from index import list_docs, parse_doc
+from spanish_analysis import SnowballFilter
+
+
+def benchmark(docs_folder, cachesize):
+    tokenizer = RegexTokenizer() | LowercaseFilter() | StopFilter(lang="es")
+    files = list_docs(docs_folder)
+    docs = []
+    for file in files:
+        fields = parse_doc(docs_folder, file)
+        docs.append([t.text for value in fields.values() if isinstance(value, str) for t in tokenizer(value)])
+    num_tokens = sum(len(tokens) for tokens in docs)
+
+    stemmer = SnowballStemmer('spanish')
+    start = time.perf_counter()
+    for tokens in docs:
+        for token in tokens:
+            stemmer.stem(token)
+    plain = time.perf_counter() - start
+
+    stem_filter = SnowballFilter('spanish', cachesize=cachesize)
+    start = time.perf_counter()
+    for tokens in docs:
+        for token in tokens:
+            stem_filter.stem(token)
+    cached = time.perf_counter() - start
+
+    info = stem_filter.cache_info()
+    print(f'Documents: {len(files)}, tokens: {num_tokens}, distinct forms: {info.misses}')
+    print(f'Cache size: {cachesize}, hit rate: {info.hits / max(info.hits + info.misses, 1):.1%}')
+    print(f'Stemming time without cache: {plain:.3f} s, with cache: {cached:.3f} s')
+    print(f'Time saved per 1000 documents: {1000 * (plain - cached) / max(len(files), 1):.3f} s')
+
+
+if __name__ == '__main__':
+    docs_folder = '../docs'
+    cachesize = 50000
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-docs':
+            docs_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-cachesize':
+            cachesize = int(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    benchmark(docs_folder, cachesize)
@@ -0,0 +1,80 @@
+"""
+benchmark_topk.py
+
+Program to compare the query latency of the exhaustive OR search of MySearcher with the top-k early termination
+path (MaxScore, see topk.py), checking that both return the same top-k scores (tied documents may be swapped).
+Besides the queries of the file, a NOT variant of each query with several words is also compared.
+Usage: python benchmark_topk.py -index <index folder> -queries <queries file> [-k <number of results>] [-model <tfidf|bm25>]
+"""
+
+import sys
+import time
+
+from search import MySearcher, percentile
+
+
+def run(searcher, queries, k):
+    latencies = []
+    rankings = []
+    for query in queries:
+        start = time.perf_counter()
+        results = searcher.search(query, limit=k)
+        rankings.append([hit.score for hit in results])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return rankings, sorted(latencies)
+
+
+def not_queries(queries):
+    # Variante con NOT de cada consulta de varias palabras ("a b c" -> "a b NOT c"): MaxScore no tiene cota para la
+    # cláusula NOT y debe volver a la búsqueda exhaustiva con los mismos resultados
+    variants = []
+    for query in queries:
+        words = query.split()
+        if len(words) > 1:
+            variants.append(' '.join(words[:-1]) + ' NOT ' + words[-1])
+    return variants
+
+
+def benchmark(index_folder, queries, k, model_type):
+    exhaustive = MySearcher(index_folder, model_type=model_type, cache_size=0)
+    early = MySearcher(index_folder, model_type=model_type, cache_size=0, early_termination=True)
+    for name, query_set in [('OR', queries), ('NOT', not_queries(queries))]:
+        if not query_set:
+            continue
+        print(f'{name} queries\tp50 ms\tp90 ms\tp99 ms')
+        expected, latencies = run(exhaustive, query_set, k)
+        print(f'exhaustive\t{percentile(latencies, 50):.2f}\t{percentile(latencies, 90):.2f}\t{percentile(latencies, 99):.2f}')
+        rankings, latencies = run(early, query_set, k)
+        print(f'maxscore\t{percentile(latencies, 50):.2f}\t{percentile(latencies, 90):.2f}\t{percentile(latencies, 99):.2f}')
+        different = sum(1 for a, b in zip(expected, rankings)
+                        if len(a) != len(b) or any(abs(x - y) > 1e-9 * max(abs(x), 1) for x, y in zip(a, b)))
+        print(f'Queries with a different top-{k}: {different} of {len(query_set)}')
+
+
+if __name__ == '__main__':
+    index_folder = '../whooshindex'
+    queries_file = None
+    k = 10
+    model_type = 'tfidf'
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-index':
+            index_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-queries':
+            queries_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-k':
+            k = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-model':
+            model_type = sys.argv[i + 1]
+            i = i + 1
+        i = i + 1
+
+    if queries_file is None:
+        print('A queries file is required (-queries <queries file>)')
+        exit(1)
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    benchmark(index_folder, queries, k, model_type)
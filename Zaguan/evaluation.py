@@ -0,0 +1,171 @@
+"""
+evaluation.py
+
+Program to evaluate the results of search.py against the relevance judgements (qrels) of the information needs.
+Computes P@k, recall, MAP and nDCG@k. It can score an existing results file (qid<TAB>identifier lines), or run the
+information needs itself with several scoring models, recording the index-open time and the query latency, so that
+quality and speed are compared in one report.
+The qrels file contains one judgement per line: qid<TAB>identifier<TAB>relevance (relevance > 0 means relevant).
+Usage: python evaluation.py -qrels <qrels file> -results <results file> [-k <cutoff>]
+       python evaluation.py -qrels <qrels file> -index <index folder> -infoNeeds <queries file> [-models tfidf,bm25] [-k <cutoff>]
+"""
+
+import math
+import sys
+import time
+
+from search import MySearcher, percentile
+
+
+def split_line(line):
+    # Los identificadores pueden contener espacios, así que se separa por tabuladores si los hay
+    line = line.rstrip('\n')
+    return line.split('\t') if '\t' in line else line.split()
+
+
+def read_qrels(qrels_file):
+    qrels = {}
+    with open(qrels_file, 'r') as f:
+        for line in f:
+            parts = split_line(line)
+            if len(parts) < 3:
+                continue
+            qid, identifier, relevance = parts[0], parts[1], int(parts[2])
+            qrels.setdefault(qid, {})[identifier] = relevance
+    return qrels
+
+
+def read_results(results_file):
+    run = {}
+    with open(results_file, 'r') as f:
+        for line in f:
+            parts = split_line(line)
+            if len(parts) < 2:
+                continue
+            run.setdefault(parts[0], []).append(parts[1])
+    return run
+
+
+def precision_at(ranking, relevant, k):
+    return sum(1 for identifier in ranking[:k] if identifier in relevant) / k
+
+
+def recall(ranking, relevant):
+    if not relevant:
+        return 0.0
+    return sum(1 for identifier in ranking if identifier in relevant) / len(relevant)
+
+
+def average_precision(ranking, relevant):
+    if not relevant:
+        return 0.0
+    hits = 0
+    total = 0.0
+    for position, identifier in enumerate(ranking, start=1):
+        if identifier in relevant:
+            hits += 1
+            total += hits / position
+    return total / len(relevant)
+
+
+def ndcg_at(ranking, judgements, k):
+    dcg = sum(judgements.get(identifier, 0) / math.log2(position + 1)
+              for position, identifier in enumerate(ranking[:k], start=1))
+    ideal = sorted((relevance for relevance in judgements.values() if relevance > 0), reverse=True)[:k]
+    idcg = sum(relevance / math.log2(position + 1) for position, relevance in enumerate(ideal, start=1))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def evaluate(qrels, run, k=10):
+    # Medidas de cada necesidad de información con juicios de relevancia y su media
+    per_query = {}
+    for qid, judgements in qrels.items():
+        relevant = {identifier for identifier, relevance in judgements.items() if relevance > 0}
+        ranking = run.get(qid, [])
+        per_query[qid] = {
+            f'P@{k}': precision_at(ranking, relevant, k),
+            'recall': recall(ranking, relevant),
+            'AP': average_precision(ranking, relevant),
+            f'nDCG@{k}': ndcg_at(ranking, judgements, k)
+        }
+    names = [f'P@{k}', 'recall', 'AP', f'nDCG@{k}']
+    means = {name: sum(m[name] for m in per_query.values()) / max(len(per_query), 1) for name in names}
+    means['MAP'] = means.pop('AP')
+    return per_query, means
+
+
+def timed_run(index_folder, queries, model_type, limit=100):
+    # Ejecuta las consultas sin caché de resultados midiendo la apertura del índice y cada consulta
+    start = time.perf_counter()
+    searcher = MySearcher(index_folder, model_type=model_type, cache_size=0)
+    open_time = time.perf_counter() - start
+    run = {}
+    latencies = []
+    for qid, query in enumerate(queries, start=1):
+        start = time.perf_counter()
+        results = searcher.search(query, limit=limit)
+        run[str(qid)] = [r.get('identifier') for r in results]
+        latencies.append((time.perf_counter() - start) * 1000)
+    searcher.searcher.close()
+    return run, open_time, sorted(latencies)
+
+
+def print_report(rows, k):
+    names = [f'P@{k}', 'recall', 'MAP', f'nDCG@{k}']
+    print('run\t' + '\t'.join(names) + '\topen ms\tp50 ms\tp99 ms')
+    for name, means, timing in rows:
+        line = f'{name}\t' + '\t'.join(f'{means[m]:.4f}' for m in names)
+        if timing:
+            open_time, latencies = timing
+            line += f'\t{open_time * 1000:.1f}\t{percentile(latencies, 50):.2f}\t{percentile(latencies, 99):.2f}'
+        else:
+            line += '\t-\t-\t-'
+        print(line)
+
+
+if __name__ == '__main__':
+    qrels_file = None
+    results_file = None
+    index_folder = None
+    info_needs_file = None
+    models = ['tfidf', 'bm25']
+    k = 10
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-qrels':
+            qrels_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-results':
+            results_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-index':
+            index_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-infoNeeds':
+            info_needs_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-models':
+            models = sys.argv[i + 1].split(',')
+            i = i + 1
+        elif sys.argv[i] == '-k':
+            k = int(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    if qrels_file is None or (results_file is None and not (index_folder and info_needs_file)):
+        print('Usage: python evaluation.py -qrels <qrels file> (-results <results file> | -index <index folder> -infoNeeds <queries file>)')
+        exit(1)
+
+    qrels = read_qrels(qrels_file)
+    rows = []
+    if results_file:
+        _, means = evaluate(qrels, read_results(results_file), k)
+        rows.append((results_file, means, None))
+    if index_folder and info_needs_file:
+        with open(info_needs_file, 'r') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        for model_type in models:
+            run, open_time, latencies = timed_run(index_folder, queries, model_type)
+            _, means = evaluate(qrels, run, k)
+            rows.append((model_type, means, (open_time, latencies)))
+    print_report(rows, k)
@@ -0,0 +1,130 @@
+"""
+grid_search.py
+
+Program to tune the query-time field boosts and the BM25F parameters of search.py over a set of information needs.
+Every combination of the values of the grid file is evaluated (see evaluation.py) in a pool of processes, and the
+configurations are printed sorted by MAP. The best one can be written as a config file for search.py -config.
+The grid file is a JSON object whose keys are B, K1, field_B.<field> or query_boosts.<field> and whose values are
+lists of values to try, e.g. {"B": [0.5, 0.75], "K1": [1.2, 2.0], "query_boosts.title": [1, 2, 4]}.
+index_boosts.<field> keys are rejected: they only take effect when the index is built (index.py -config).
+Usage: python grid_search.py -index <index folder> -infoNeeds <queries file> -qrels <qrels file> -grid <grid file>
+       [-procs <number of processes>] [-k <cutoff>] [-output <best config file>]
+"""
+
+import itertools
+import json
+import sys
+
+from multiprocessing import Pool
+
+from evaluation import read_qrels, evaluate
+from index import load_config
+from search import MySearcher
+
+
+# Claves que se pueden ajustar sin volver a indexar: los boosts de index_boosts se aplican al crear el índice
+GRID_PARAMETERS = ['B', 'K1']
+GRID_SECTIONS = ['field_B', 'query_boosts']
+
+
+def check_grid(grid):
+    for key in grid:
+        if key.startswith('index_boosts.'):
+            raise ValueError(f'{key}: index_boosts are applied by index.py, rebuild the index with -config to try them')
+        if key not in GRID_PARAMETERS and ('.' not in key or key.split('.', 1)[0] not in GRID_SECTIONS):
+            raise ValueError(f'{key}: unknown grid key, expected {", ".join(GRID_PARAMETERS)} or '
+                             f'{", ".join(section + ".<field>" for section in GRID_SECTIONS)}')
+
+
+def grid_configs(grid):
+    check_grid(grid)
+    keys = sorted(grid)
+    for values in itertools.product(*(grid[key] for key in keys)):
+        config = load_config()
+        for key, value in zip(keys, values):
+            if '.' in key:
+                section, field = key.split('.', 1)
+                config[section][field] = value
+            else:
+                config[key] = value
+        yield dict(zip(keys, values)), config
+
+
+def evaluate_config(args):
+    index_folder, queries, qrels, k, params, config = args
+    searcher = MySearcher(index_folder, model_type='bm25', cache_size=0, config=config)
+    run = {}
+    for qid, query in enumerate(queries, start=1):
+        run[str(qid)] = [r.get('identifier') for r in searcher.search(query, limit=100)]
+    searcher.searcher.close()
+    _, means = evaluate(qrels, run, k)
+    return params, config, means
+
+
+def grid_search(index_folder, queries, qrels, grid, procs=1, k=10):
+    tasks = [(index_folder, queries, qrels, k, params, config) for params, config in grid_configs(grid)]
+    print(f'Configurations: {len(tasks)}, processes: {procs}')
+    if procs > 1:
+        with Pool(procs) as pool:
+            evaluations = pool.map(evaluate_config, tasks)
+    else:
+        evaluations = [evaluate_config(task) for task in tasks]
+    evaluations.sort(key=lambda e: e[2]['MAP'], reverse=True)
+
+    print(f'MAP\tP@{k}\tnDCG@{k}\tconfiguration')
+    for params, _, means in evaluations:
+        print(f"{means['MAP']:.4f}\t{means[f'P@{k}']:.4f}\t{means[f'nDCG@{k}']:.4f}\t{json.dumps(params)}")
+    return evaluations[0][1] if evaluations else None
+
+
+if __name__ == '__main__':
+    index_folder = '../whooshindex'
+    info_needs_file = None
+    qrels_file = None
+    grid_file = None
+    output_file = None
+    procs = 1
+    k = 10
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-index':
+            index_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-infoNeeds':
+            info_needs_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-qrels':
+            qrels_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-grid':
+            grid_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-output':
+            output_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-procs':
+            procs = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-k':
+            k = int(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    if not (info_needs_file and qrels_file and grid_file):
+        print('Usage: python grid_search.py -index <index folder> -infoNeeds <queries file> -qrels <qrels file> -grid <grid file>')
+        exit(1)
+    with open(info_needs_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    with open(grid_file, 'r') as f:
+        grid = json.load(f)
+
+    try:
+        check_grid(grid)
+    except ValueError as error:
+        print(error)
+        exit(1)
+    best = grid_search(index_folder, queries, read_qrels(qrels_file), grid, procs=procs, k=k)
+    if output_file and best is not None:
+        with open(output_file, 'w') as f:
+            json.dump(best, f, indent=2)
+        print(f'Best configuration written to {output_file}')
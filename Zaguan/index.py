@@ -5,13 +5,21 @@ Last update: 2025-9-16
 
 Simple program to create an inverted index with the contents of text/xml files contained in a docs folder
 This program is based on the whoosh library. See https://pypi.org/project/Whoosh/ .
-Usage: python index.py -index <index folder> -docs <docs folder>
+Usage: python index.py -index <index folder> -docs <docs folder> [-procs <number of processes>] [-incremental] [-profile <full|compact>] [-snippets] [-config <config file>]
+       [-shards <number of shards>] [-merge <default|none|tiered|optimize>]
+With -shards the documents are distributed by a hash of their identifier among the shard_<n> subfolders of the index
+folder, each one an independent whoosh index with its own segments and merges (see MySearcher in search.py). A full
+(not -incremental) build removes the shards, or the unsharded index, left in the folder by a previous build.
+-merge selects how the existing segments are merged on commit: whoosh's default policy, none (fast commits that only
+add a new segment), tiered (see tiered_merge) or optimize (a single segment). See segments.py to inspect and compact
+the segments of an index.
 """
 
-from whoosh.index import create_in
+from whoosh.index import create_in, open_dir, exists_in
 from whoosh.fields import *
-from whoosh.analysis import RegexTokenizer, LowercaseFilter, StopFilter, Filter
-from nltk.stem.snowball import SnowballStemmer
+from whoosh.reading import SegmentReader
+from whoosh.filedb.filestore import FileStorage
+from spanish_analysis import spanish_analyzer
 
 import os
 
@@ -19,109 +27,342 @@ import sys
 
 import datetime
 
+import re
+
+import shutil
+
+import json
+
+import zlib
+
 import xml.etree.ElementTree as ET
 
+from functools import partial
+from multiprocessing import Pool
+
 def create_folder(folder_name):
     if (not os.path.exists(folder_name)):
         os.mkdir(folder_name)
 
-class SnowballFilter(Filter):
-    def __init__(self, language='spanish'):
-        self.stemmer = SnowballStemmer(language)
+def modified_time(file_path):
+    return datetime.datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%a, %d %b %Y %H:%M:%S +0000')
+
+def parse_txt_doc(foldername, filename):
+    file_path = os.path.join(foldername, filename)
+    # print(file_path)
+    with open(file_path) as fp:
+        text = ' '.join(line for line in fp if line)
+    # print(text)
+    return dict(path=filename, content=text, modified=modified_time(file_path))
+
+# Campo del esquema al que se envía cada elemento Dublin Core
+DC_FIELDS = {
+    'title': 'title',               # título del trabajo
+    'type': 'type_of_work',         # tipo de trabajo (TFG, TFM, Tesis Doctoral...)
+    'contributor': 'director',      # puede haber varios directores
+    'creator': 'author',            # autor de la tesis
+    'date': 'date',                 # fecha de defensa de la tesis
+    'publisher': 'department',      # departamento al que se adscribe el trabajo
+    'subject': 'subject',           # temas que trata el trabajo
+    'description': 'description',   # descripción o palabras clave
+    'identifier': 'identifier'      # identificador del trabajo
+}
+
+def walk_xml(elem, values, texts):
+    # Recorrido en profundidad de los descendientes de elem: envía cada elemento Dublin Core a su campo y reúne el texto
+    # (text de cada elemento y tail de cada hijo) en el mismo orden que elem.itertext()
+    if elem.text:
+        texts.append(elem.text)
+    for child in elem:
+        field = DC_FIELDS.get(child.tag.rsplit('}', 1)[-1])
+        if field and child.text:
+            values[field].append(child.text.strip())
+        walk_xml(child, values, texts)
+        if child.tail:
+            texts.append(child.tail)
+
+def parse_xml_doc(foldername, filename):
+    file_path = os.path.join(foldername, filename)
+    tree = ET.parse(file_path)
+    root = tree.getroot()
+    # Un único recorrido del árbol envía cada elemento Dublin Core a su campo y construye content
+    # (equivale a root.findall('.//{*}...') para cada campo, que recorría el árbol nueve veces, más root.itertext())
+    values = {field: [] for field in DC_FIELDS.values()}
+    texts = []
+    walk_xml(root, values, texts)
+
+    raw_text = "".join(texts)
+    text = ' '.join(line.strip() for line in raw_text.splitlines() if line)
+    fields = {field: ' '.join(texts) for field, texts in values.items()}
+    return dict(
+        path=filename,
+        content=text,
+        modified=modified_time(file_path),
+        **fields
+    )
+
+# Primer año (4 cifras) que aparece en el texto de dc:date
+YEAR_PATTERN = re.compile(r'\b(1[5-9]\d\d|2\d\d\d)\b')
+
+def parse_year(date):
+    match = YEAR_PATTERN.search(date)
+    return int(match.group(1)) if match else None
+
+# Campos de texto que se copian a una columna "<campo>_facet" para filtrar y contar facetas
+FACET_SOURCES = ['department', 'type_of_work']
+
+# Configuración de la relevancia (fichero JSON) compartida por index.py y search.py:
+#  index_boosts: boost de cada campo al indexar (index.py), query_boosts: boost de cada campo en la consulta (search.py),
+#  B y K1: parámetros del modelo BM25F, field_B: valor de B para campos concretos
+DEFAULT_CONFIG = {'index_boosts': {}, 'query_boosts': {}, 'B': 0.75, 'K1': 1.2, 'field_B': {}}
+
+def load_config(config_file=None):
+    config = {key: (dict(value) if isinstance(value, dict) else value) for key, value in DEFAULT_CONFIG.items()}
+    if config_file:
+        with open(config_file, 'r') as f:
+            config.update(json.load(f))
+    return config
+
+def parse_doc(foldername, filename):
+    if filename.endswith('.xml'):
+        return parse_xml_doc(foldername, filename)
+    return parse_txt_doc(foldername, filename)
+
+def list_docs(docs_folder):
+    return [file for file in sorted(os.listdir(docs_folder)) if file.endswith('.xml') or file.endswith('.txt')]
+
+# Política de fusión por niveles: los segmentos se agrupan por orden de magnitud de su número de documentos
+# y un nivel se fusiona cuando acumula SEGMENTS_PER_TIER segmentos
+TIER_FACTOR = 10
+SEGMENTS_PER_TIER = 10
+# Los segmentos con más de esta proporción de documentos borrados se reescriben para recuperar el espacio
+MAX_DELETED_RATIO = 0.3
+
+def segment_tier(segment):
+    docs = segment.doc_count()
+    tier = 0
+    while docs >= TIER_FACTOR:
+        docs //= TIER_FACTOR
+        tier += 1
+    return tier
+
+def tiered_merge(writer, segments):
+    # Función de fusión para writer.commit(mergetype=...): añade al nuevo segmento los segmentos a fusionar
+    # y devuelve los que se mantienen
+    tiers = {}
+    to_merge = []
+    for segment in segments:
+        if segment.doc_count_all() and segment.deleted_count() / segment.doc_count_all() > MAX_DELETED_RATIO:
+            to_merge.append(segment)
+        else:
+            tiers.setdefault(segment_tier(segment), []).append(segment)
+    unchanged = []
+    for tier_segments in tiers.values():
+        if len(tier_segments) >= SEGMENTS_PER_TIER:
+            to_merge.extend(tier_segments)
+        else:
+            unchanged.extend(tier_segments)
+    for segment in to_merge:
+        reader = SegmentReader(writer.storage, writer.schema, segment)
+        writer.add_reader(reader)
+        reader.close()
+    return unchanged
+
+# Argumentos de writer.commit para cada política de fusión
+MERGE_POLICIES = {
+    'default': {},
+    'none': {'merge': False},
+    'tiered': {'mergetype': tiered_merge},
+    'optimize': {'optimize': True}
+}
 
-    def __call__(self, tokens):
-        for t in tokens:
-            t.text = self.stemmer.stem(t.text)
-            yield t
+SHARD_PREFIX = 'shard_'
 
-spanish_analyzer = RegexTokenizer() | LowercaseFilter() | StopFilter(lang="es") #| SnowballFilter('spanish')
+def shard_folders(index_folder):
+    # Carpetas de los shards de un índice creado con -shards, ordenadas por número de shard
+    if not os.path.isdir(index_folder):
+        return []
+    shards = [name for name in os.listdir(index_folder)
+              if name.startswith(SHARD_PREFIX) and name[len(SHARD_PREFIX):].isdigit()]
+    return [os.path.join(index_folder, name) for name in sorted(shards, key=lambda name: int(name[len(SHARD_PREFIX):]))]
+
+def remove_shards(index_folder, keep=0):
+    # Borra las carpetas de shard a partir de la número keep, que quedarían de una construcción anterior con más shards
+    # (MySearcher abre todas las carpetas shard_<n> del índice)
+    for folder in shard_folders(index_folder):
+        if int(os.path.basename(folder)[len(SHARD_PREFIX):]) >= keep:
+            shutil.rmtree(folder)
+
+def shard_of(fields, shards):
+    # crc32 es estable entre ejecuciones (hash() de str no lo es); los .txt no tienen identifier y se reparten por path
+    key = fields.get('identifier') or fields['path']
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+def same_schema(old_schema, schema):
+    # update_document necesita que path sea único, y los documentos nuevos tienen todos los campos del esquema actual
+    return old_schema['path'].unique and set(old_schema.names()) == set(schema.names())
 
 class MyIndex:
-    def __init__(self,index_folder):
+    def __init__(self,index_folder, procs=1, incremental=False, profile='full', snippets=False, config=None,
+                 merge='default'):
         # Para poder filtrar por autor, director, departamento al que se adscribe el trabajo,
         #  términos contenidos en el título, descripción o palabras clave  y año de defensa
-        schema = Schema(path=ID(stored=True), 
-                        content=TEXT(analyzer=spanish_analyzer, stored=True), 
-                        title=TEXT(analyzer=spanish_analyzer, stored=True), 
-                        subject=TEXT(analyzer=spanish_analyzer, stored=True),
-                        type_of_work=TEXT(analyzer=spanish_analyzer, stored=True),
-                        author=TEXT(analyzer=spanish_analyzer, stored=True),
-                        director=TEXT(analyzer=spanish_analyzer, stored=True),
-                        date=ID(stored=True),
-                        department=TEXT(analyzer=spanish_analyzer, stored=True),
-                        description=TEXT(analyzer=spanish_analyzer, stored=True),
+        # Con el perfil 'compact' solo se almacenan path, identifier, title y modified; el resto de campos
+        # se recupera del fichero original cuando se necesita (ver MySearcher.document en search.py)
+        stored = profile != 'compact'
+        boosts = (config or load_config())['index_boosts']
+        schema = Schema(path=ID(stored=True, unique=True), 
+                        # con snippets=True se guardan las posiciones de carácter de cada término en content para resaltar
+                        # los términos de la consulta sin volver a analizar el texto
+                        content=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('content', 1.0), stored=stored, chars=snippets), 
+                        title=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('title', 1.0), stored=True), 
+                        subject=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('subject', 1.0), stored=stored),
+                        type_of_work=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('type_of_work', 1.0), stored=stored),
+                        author=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('author', 1.0), stored=stored),
+                        director=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('director', 1.0), stored=stored),
+                        date=ID(stored=stored, sortable=True),
+                        # año de defensa como columna numérica para consultas por rango de años
+                        year=NUMERIC(stored=stored, sortable=True),
+                        department=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('department', 1.0), stored=stored),
+                        # copias sin analizar (con columna) para filtros y facetas
+                        department_facet=ID(sortable=True),
+                        type_of_work_facet=ID(sortable=True),
+                        description=TEXT(analyzer=spanish_analyzer, field_boost=boosts.get('description', 1.0), stored=stored),
                         identifier=ID(stored=True),
                         modified=STORED
         )
                 
         create_folder(index_folder)
-        index = create_in(index_folder, schema)
-        self.writer = index.writer()
+        # En modo incremental se reutiliza el índice existente (si lo hay) en lugar de crearlo de cero
+        self.incremental = incremental and exists_in(index_folder)
+        if self.incremental:
+            index = open_dir(index_folder)
+            if not same_schema(index.schema, schema):
+                # Un índice anterior (path no único o sin los campos nuevos) duplicaría documentos o rechazaría los campos
+                print(f'The index in {index_folder} was created with an older schema, rebuild it without -incremental')
+                exit(1)
+        else:
+            # Un índice sin shards quedaría oculto tras los shards de una construcción anterior
+            remove_shards(index_folder)
+            index = create_in(index_folder, schema)
+        self.index = index
+        self.procs = procs
+        self.merge = merge
+        # Con procs > 1 whoosh devuelve un MpWriter que reparte el análisis de los documentos
+        # entre varios procesos y fusiona sus segmentos al hacer commit (salvo sin fusiones, en cuyo caso
+        # cada proceso deja su propio segmento)
+        self.writer = index.writer(procs=procs, multisegment=merge == 'none')
 
     def index_docs(self,docs_folder):
         if (os.path.exists(docs_folder)):
-            for file in sorted(os.listdir(docs_folder)):
-                # print(file)
-                if file.endswith('.xml'):
-                    self.index_xml_doc(docs_folder, file)
-                elif file.endswith('.txt'):
-                    self.index_txt_doc(docs_folder, file)
-        self.writer.commit()
+            files = list_docs(docs_folder)
+            if self.incremental:
+                files = self.changed_docs(docs_folder, files)
+                print(f'New or modified documents: {len(files)}')
+            if self.procs > 1:
+                # El parseo de los ficheros también se reparte entre procesos (manteniendo el orden)
+                with Pool(self.procs) as pool:
+                    for fields in pool.imap(partial(parse_doc, docs_folder), files, chunksize=16):
+                        self.add_document(fields)
+            else:
+                for file in files:
+                    # print(file)
+                    if file.endswith('.xml'):
+                        self.index_xml_doc(docs_folder, file)
+                    elif file.endswith('.txt'):
+                        self.index_txt_doc(docs_folder, file)
+        self.commit()
+
+    def changed_docs(self, docs_folder, files):
+        stored = self.stored_modified()
+        # Se eliminan del índice los documentos cuyos ficheros ya no existen
+        removed = set(stored) - set(files)
+        for path in removed:
+            self.delete_document(path)
+        print(f'Removed documents: {len(removed)}')
+        return [file for file in files if stored.get(file) != modified_time(os.path.join(docs_folder, file))]
+
+    def stored_modified(self):
+        # Fecha de modificación almacenada en el índice para cada fichero
+        with self.index.searcher() as searcher:
+            return {fields['path']: fields.get('modified') for fields in searcher.all_stored_fields()}
+
+    def delete_document(self, path):
+        self.writer.delete_by_term('path', path)
+
+    def commit(self):
+        self.writer.commit(**MERGE_POLICIES[self.merge])
+
+    def add_document(self, fields):
+        for field in FACET_SOURCES:
+            if field in fields:
+                fields[field + '_facet'] = fields[field]
+        year = parse_year(fields.get('date', ''))
+        if year is not None:
+            fields['year'] = year
+        if self.incremental:
+            # Reemplaza la versión anterior del documento (path es un campo único)
+            self.writer.update_document(**fields)
+        else:
+            self.writer.add_document(**fields)
 
     def index_txt_doc(self, foldername,filename):
-        file_path = os.path.join(foldername, filename)
-        # print(file_path)
-        with open(file_path) as fp:
-            text = ' '.join(line for line in fp if line)
-        # print(text)
-        modified = datetime.datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%a, %d %b %Y %H:%M:%S +0000')
-        self.writer.add_document(path=filename, content=text, modified=modified )
+        self.add_document(parse_txt_doc(foldername, filename))
 
     def index_xml_doc(self, foldername, filename):
-        file_path = os.path.join(foldername, filename)
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        # título del trabajo
-        title = ' '.join([elem.text.strip() for elem in root.findall('.//{*}title') if elem.text])
-        # tipo de trabajo (TFG, TFM, Tesis Doctoral...)
-        type_of_work = ' '.join([elem.text.strip() for elem in root.findall('.//{*}type') if elem.text])
-        # puede haber varios directores
-        director= ' '.join([elem.text.strip() for elem in root.findall('.//{*}contributor') if elem.text])
-        # autor de la tesis
-        author = ' '.join([elem.text.strip() for elem in root.findall('.//{*}creator') if elem.text])
-        # fecha de defensa de la tesis
-        date = ' '.join([elem.text.strip() for elem in root.findall('.//{*}date') if elem.text])
-        # departamento al que se adscribe el trabajo
-        department = ' '.join([elem.text.strip() for elem in root.findall('.//{*}publisher') if elem.text])
-        # temas que trata el trabajo
-        subject = ' '.join([elem.text.strip() for elem in root.findall('.//{*}subject') if elem.text])
-        # descripción o palabras clave
-        description = ' '.join([elem.text.strip() for elem in root.findall('.//{*}description') if elem.text])
-        # identificador del trabajo
-        identifier = ' '.join([elem.text.strip() for elem in root.findall('.//{*}identifier') if elem.text])
-
-        raw_text = "".join(root.itertext())
-        text = ' '.join(line.strip() for line in raw_text.splitlines() if line)
-        modified = datetime.datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%a, %d %b %Y %H:%M:%S +0000')
-        self.writer.add_document(
-            path=filename,
-            content=text,
-            title=title,
-            type_of_work=type_of_work,
-            author=author,
-            director=director,
-            subject=subject,
-            description=description,
-            date=date,
-            department=department,
-            identifier=identifier,
-            modified=modified
-        )
+        self.add_document(parse_xml_doc(foldername, filename))
+
+class MyShardedIndex(MyIndex):
+    # Índice repartido en varios índices de whoosh (shards) más pequeños: cada uno fusiona solo sus propios
+    # segmentos, así que el coste de las fusiones no crece con el tamaño de la colección completa
+    def __init__(self, index_folder, shards, procs=1, incremental=False, profile='full', snippets=False, config=None,
+                 merge='default'):
+        create_folder(index_folder)
+        if not incremental:
+            # Se eliminan los shards sobrantes y los ficheros de un índice anterior sin shards
+            remove_shards(index_folder, keep=shards)
+            if exists_in(index_folder):
+                FileStorage(index_folder).clean(ignore=True)
+        self.shards = [MyIndex(os.path.join(index_folder, f'{SHARD_PREFIX}{n}'), procs=procs, incremental=incremental,
+                               profile=profile, snippets=snippets, config=config, merge=merge)
+                       for n in range(shards)]
+        self.incremental = all(shard.incremental for shard in self.shards)
+        self.procs = procs
+
+    def stored_modified(self):
+        stored = {}
+        for shard in self.shards:
+            stored.update(shard.stored_modified())
+        return stored
+
+    def delete_document(self, path):
+        for shard in self.shards:
+            shard.delete_document(path)
+
+    def add_document(self, fields):
+        target = self.shards[shard_of(fields, len(self.shards))]
+        if self.incremental:
+            # Si ha cambiado el identifier del documento, su versión anterior puede estar en otro shard
+            for shard in self.shards:
+                if shard is not target:
+                    shard.delete_document(fields['path'])
+        target.add_document(fields)
+
+    def commit(self):
+        for shard in self.shards:
+            shard.commit()
 
 if __name__ == '__main__':
 
     index_folder = '../whooshindex'
     docs_folder = '../docs'
+    procs = 1
+    incremental = False
+    profile = 'full'
+    snippets = False
+    config_file = None
+    shards = 0
+    merge = 'default'
     i = 1
     while i < len(sys.argv):
         if sys.argv[i] == '-index':
@@ -130,7 +371,43 @@ if __name__ == '__main__':
         elif sys.argv[i] == '-docs':
             docs_folder = sys.argv[i + 1]
             i = i + 1
+        elif sys.argv[i] == '-procs':
+            procs = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-incremental':
+            incremental = True
+        elif sys.argv[i] == '-profile':
+            # -profile is expected to be either 'full' or 'compact'
+            profile = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-snippets':
+            snippets = True
+        elif sys.argv[i] == '-config':
+            config_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-shards':
+            shards = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-merge':
+            merge = sys.argv[i + 1]
+            i = i + 1
         i = i + 1
 
-    my_index = MyIndex(index_folder)
+    if profile not in ('full', 'compact'):
+        print('Index profile not recognized')
+        exit(1)
+    if merge not in MERGE_POLICIES:
+        print('Merge policy not recognized')
+        exit(1)
+    existing_shards = len(shard_folders(index_folder))
+    if incremental and (existing_shards or exists_in(index_folder)) and existing_shards != shards:
+        # Con otro número de shards (o sin shards) los documentos cambiarían de shard: hay que reconstruir el índice
+        print(f'The index has {existing_shards} shards, it cannot be updated with {shards}')
+        exit(1)
+    if shards > 0:
+        my_index = MyShardedIndex(index_folder, shards, procs=procs, incremental=incremental, profile=profile,
+                                  snippets=snippets, config=load_config(config_file), merge=merge)
+    else:
+        my_index = MyIndex(index_folder, procs=procs, incremental=incremental, profile=profile, snippets=snippets,
+                           config=load_config(config_file), merge=merge)
     my_index.index_docs(docs_folder)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+load_test.py
+
+Load test for server.py. Sends the queries of a file (one per line) from several concurrent clients
+and reports the throughput (QPS) and the p50/p99 latency of the answers.
+Usage: python load_test.py -queries <queries file> [-url <server url>] [-clients <number of clients>] [-requests <number of requests>]
+"""
+
+import json
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from search import percentile
+
+
+def send_query(url, query, limit):
+    start = time.perf_counter()
+    with urlopen(f'{url}?{urlencode({"q": query, "limit": limit})}') as response:
+        json.load(response)
+    return time.perf_counter() - start
+
+
+def load_test(url, queries, clients, requests, limit=10):
+    tasks = [queries[n % len(queries)] for n in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(pool.map(lambda query: send_query(url, query, limit), tasks))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency in latencies)
+    print(f'Requests: {requests}, clients: {clients}, elapsed: {elapsed:.2f} s, QPS: {requests / elapsed:.1f}')
+    print(f'Latency (ms): p50 {percentile(latencies, 50):.2f}, p99 {percentile(latencies, 99):.2f}')
+
+
+if __name__ == '__main__':
+    url = 'http://localhost:8000/search'
+    queries_file = None
+    clients = 8
+    requests = 1000
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-url':
+            url = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-queries':
+            queries_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-clients':
+            clients = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-requests':
+            requests = int(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    if queries_file is None:
+        print('A queries file is required (-queries <queries file>)')
+        exit(1)
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    load_test(url, queries, clients, requests)
@@ -5,61 +5,358 @@ Last update: 2025-9-16
 
 Program to search a free text query on a previously created inverted index.
 This program is based on the whoosh library. See https://pypi.org/project/Whoosh/ .
-Usage: python search.py -index <index folder>
+Usage: python search.py -index <index folder> [-docs <docs folder>] [-infoNeeds <queries file> -output <results file> [-procs <number of searchers>]]
+       [-filter <department|type_of_work|date>=<value>]... [-facets] [-topk <number of results>] [-pagelen <results per page>] [-snippets]
+       [-model <tfidf|bm25>] [-config <config file>]
+The index folder may also be a sharded index (index.py -shards): the shards are searched in parallel and their top-k
+merged, with the IDF and average field lengths of the whole collection.
+In interactive mode the results are shown in pages of -pagelen results; -topk only enables early termination there.
+Queries may restrict the defense year with year:2015-2020 (also year:[2015 TO 2020], year:2015.., year:2015).
 """
 
+import math
+import re
 import sys
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
 
 from whoosh.qparser import QueryParser
 from whoosh.qparser import OrGroup
 from whoosh import scoring
+from whoosh import sorting
+from whoosh import highlight
+from whoosh.query import And, Or, Term, Every, NumericRange
 from whoosh.qparser import MultifieldParser
-from nltk.stem.snowball import SnowballStemmer
+from whoosh.reading import MultiReader
+from whoosh.searching import Searcher
 import whoosh.index as index
+from index import parse_doc, load_config, shard_folders
+from topk import max_score_search, TopKResults
+
+
 
+# Campo con columna (sortable) sobre el que se filtra y se cuentan facetas para cada campo de búsqueda
+FACET_FIELDS = {'department': 'department_facet', 'type_of_work': 'type_of_work_facet', 'date': 'date'}
 
+# Rango de años de defensa: year:2015-2020, year:2015..2020, year:[2015 TO 2020], year:2015- o year:2015
+# (también "año:"). Se aplica como filtro sobre la columna numérica year, no como parte de la consulta puntuada
+YEAR_RANGE = re.compile(r'\b(?:year|año):(?:\[\s*(?P<start>\d{4})?\s*TO\s*(?P<end>\d{4})?\s*\]'
+                        r'|(?P<start2>\d{4})?\s*(?:-|–|\.\.)\s*(?P<end2>\d{4})?|(?P<year>\d{4}))', re.IGNORECASE)
+
+def extract_year_range(query_text):
+    # Devuelve la consulta sin la expresión de rango y los años inicial y final (None si no hay límite)
+    match = YEAR_RANGE.search(query_text)
+    if not match:
+        return query_text, None
+    if match.group('year'):
+        start = end = match.group('year')
+    else:
+        start = match.group('start') or match.group('start2')
+        end = match.group('end') or match.group('end2')
+    remaining = (query_text[:match.start()] + ' ' + query_text[match.end():]).strip()
+    return remaining, (int(start) if start else None, int(end) if end else None)
 
 class MySearcher:
-    def __init__(self, index_folder, model_type = 'tfidf', info=False):
-        ix = index.open_dir(index_folder)
+    def __init__(self, index_folder, model_type = 'tfidf', info=False, cache_size=1000, docs_folder=None,
+                 early_termination=False, snippets=False, config=None):
+        # Boosts de los campos en la consulta y parámetros de BM25F (ver index.load_config)
+        config = config or load_config()
         if model_type == 'tfidf':
             # Apply a vector retrieval model as default
-            self.searcher = ix.searcher(weighting=scoring.TF_IDF())
+            self.weighting = scoring.TF_IDF()
         else:
             # Apply the probabilistic BM25F model, the default model in searcher method
-            self.searcher = ix.searcher()
+            field_B = {f'{field}_B': value for field, value in config['field_B'].items()}
+            self.weighting = scoring.BM25F(B=config['B'], K1=config['K1'], **field_B)
+        # Índice dividido en shards (index.py -shards): se abre cada shard y se buscan en paralelo
+        self.shards = [index.open_dir(folder) for folder in shard_folders(index_folder)]
+        if self.shards:
+            self.pool = ThreadPoolExecutor(max_workers=len(self.shards))
+            self.searcher = self.open_shards()
+        else:
+            self.searcher = index.open_dir(index_folder).searcher(weighting=self.weighting)
         fields = ["author", "director", "department", "title", "description", "subject", "date", "content"]
-        self.parser = MultifieldParser(fields, ix.schema, group=OrGroup)
+        self.parser = MultifieldParser(fields, self.searcher.schema, fieldboosts=config['query_boosts'], group=OrGroup)
         self.info = info
+        self.model_type = model_type
+        # Carpeta de los documentos originales, necesaria con índices creados con el perfil 'compact'
+        self.docs_folder = docs_folder
+        # Con limit, puntuar con MaxScore (ver topk.py) saltando documentos que no pueden entrar en el top-k
+        self.early_termination = early_termination
+        # Fragmentos de content con los términos de la consulta resaltados. Si el índice guarda las posiciones
+        # de carácter (index.py -snippets) se usan directamente; si no, hay que volver a analizar el texto
+        self.snippets = snippets
+        if self.searcher.schema['content'].supports('characters'):
+            fragmenter = highlight.PinpointFragmenter(autotrim=True, surround=40)
+        else:
+            fragmenter = highlight.ContextFragmenter(surround=40)
+        self.highlighter = highlight.Highlighter(fragmenter=fragmenter, formatter=highlight.UppercaseFormatter())
+        # Caché LRU de resultados, válida solo para la generación del índice con la que se calcularon
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_generation = self.generation()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def open_shards(self):
+        # Un único Searcher sobre los segmentos de todos los shards. Sus subsearchers (uno por segmento) toman el
+        # número de documentos, las frecuencias de documento y las longitudes medias de este searcher padre, así que
+        # las puntuaciones de los distintos shards son las de un índice sin dividir y se pueden mezclar directamente
+        readers = []
+        self.shard_generations = []
+        self.shard_leaves = []
+        for ix in self.shards:
+            reader = ix.reader()
+            self.shard_generations.append(reader.generation())
+            leaves = [reader] if reader.is_atomic() else [leaf for leaf, _ in reader.leaf_readers()]
+            self.shard_leaves.append(range(len(readers), len(readers) + len(leaves)))
+            readers.extend(leaves)
+        return Searcher(MultiReader(readers), weighting=self.weighting)
+
+    def generation(self):
+        if self.shards:
+            return tuple(self.shard_generations)
+        return self.searcher.reader().generation()
+
+    def refresh(self):
+        # Reabre el lector si el índice ha cambiado en disco (nueva generación)
+        if self.shards:
+            if tuple(ix.latest_generation() for ix in self.shards) == self.generation():
+                return False
+            self.searcher.close()
+            self.searcher = self.open_shards()
+        elif self.searcher.up_to_date():
+            return False
+        else:
+            self.searcher = self.searcher.refresh()
+        self.parser.schema = self.searcher.schema
+        return True
+
+    def check_facet_fields(self, names):
+        # Los índices creados antes de las columnas de facetas no tienen department_facet ni type_of_work_facet
+        missing = [FACET_FIELDS[name] for name in names if FACET_FIELDS[name] not in self.searcher.schema]
+        if missing:
+            raise ValueError(f'The index has no facet columns ({", ".join(missing)}), rebuild it with index.py to use filters and facets')
+
+    def build_filter(self, filters):
+        # Cada campo admite uno o varios valores (OR); los distintos campos se combinan con AND.
+        # whoosh evalúa el filtro como un conjunto de documentos antes de puntuar
+        self.check_facet_fields(filters)
+        clauses = []
+        for name, values in sorted(filters.items()):
+            if isinstance(values, str):
+                values = [values]
+            clauses.append(Or([Term(FACET_FIELDS[name], value) for value in values]))
+        return And(clauses)
+
+    def parse(self, query_text, filters=None):
+        # Devuelve la consulta a puntuar y el filtro (o None) que se aplica antes de puntuar
+        query_text, year_range = extract_year_range(query_text)
+        filter_queries = []
+        if filters:
+            filter_queries.append(self.build_filter(filters))
+        if year_range:
+            if 'year' not in self.searcher.schema:
+                raise ValueError('The index has no year column, rebuild it with index.py to search by year')
+            filter_queries.append(NumericRange('year', year_range[0], year_range[1]))
+        # Una consulta con solo el rango de años devuelve todos los documentos del rango
+        query = self.parser.parse(query_text) if query_text else Every()
+        if not filter_queries:
+            return query, None
+        return query, And(filter_queries) if len(filter_queries) > 1 else filter_queries[0]
+
+    def search_shard(self, leaves, query, query_filter, limit):
+        # top-k de un shard, con los números de documento del searcher global
+        top_n = []
+        for leaf in leaves:
+            subsearcher, offset = self.searcher.subsearchers[leaf]
+            if self.early_termination and limit:
+                results = max_score_search(subsearcher, query, limit, query_filter=query_filter)
+            else:
+                results = subsearcher.search(query, limit=limit, filter=query_filter)
+            top_n.extend((score, docnum + offset) for score, docnum in results.top_n)
+        return top_n
+
+    def search_shards(self, query, query_filter=None, limit=None):
+        start = time.perf_counter()
+        # Las estadísticas globales de los términos se calculan (y quedan en la caché de IDF del searcher padre)
+        # antes de repartir la consulta, de modo que cada hilo solo lee los segmentos de su shard
+        for fieldname, text in query.existing_terms(self.searcher.reader(), expand=True):
+            self.searcher.idf(fieldname, text)
+        shard_results = self.pool.map(lambda leaves: self.search_shard(leaves, query, query_filter, limit),
+                                      self.shard_leaves)
+        # Mezcla de los top-k: como en whoosh, a igual puntuación va antes el documento con menor número
+        top_n = sorted((item for top in shard_results for item in top), key=lambda item: (-item[0], item[1]))
+        return TopKResults(self.searcher, query, top_n[:limit], query_filter=query_filter,
+                           runtime=time.perf_counter() - start)
+
+    def search_query(self, query, query_filter=None, limit=None):
+        if self.shards:
+            return self.search_shards(query, query_filter, limit)
+        if self.early_termination and limit:
+            return max_score_search(self.searcher, query, limit, query_filter=query_filter)
+        return self.searcher.search(query, limit=limit, filter=query_filter, terms=self.snippets)
+
+    def run_search(self, query_text, limit, filters, facets):
+        query, query_filter = self.parse(query_text, filters)
+        if query_filter is not None and next(iter(self.searcher.docs_for_query(query_filter)), None) is None:
+            # whoosh no aplica un filtro vacío al contar el total de una búsqueda con limit (daría el total sin filtrar)
+            return TopKResults(self.searcher, query, [], query_filter=query_filter)
+        if not facets:
+            return self.search_query(query, query_filter, limit)
+        kwargs = {'terms': self.snippets}
+        if query_filter is not None:
+            kwargs['filter'] = query_filter
+        if facets:
+            self.check_facet_fields(FACET_FIELDS)
+            # Las facetas se cuentan sobre todos los documentos que cumplen la consulta, en la misma búsqueda
+            kwargs['groupedby'] = {name: sorting.FieldFacet(field, maptype=sorting.Count)
+                                   for name, field in FACET_FIELDS.items()}
+        return self.searcher.search(query, limit=limit, **kwargs)
+
+    def facet_counts(self, results):
+        counts = {}
+        for name in results.facet_names():
+            groups = results.groups(name)
+            counts[name] = sorted(((value, count) for value, count in groups.items() if value),
+                                  key=lambda x: (-x[1], x[0]))
+        return counts
 
-    def search(self, query_text, limit=None):
-        query = self.parser.parse(query_text)
-        return self.searcher.search(query, limit=limit)
+    def search(self, query_text, limit=None, filters=None, facets=False):
+        if self.cache_size <= 0:
+            return self.run_search(query_text, limit, filters, facets)
+        generation = self.generation()
+        if generation != self.cache_generation:
+            self.cache.clear()
+            self.cache_generation = generation
+        # Solo se normalizan los espacios: los operadores del parser (AND, OR, NOT) distinguen mayúsculas
+        filter_key = tuple(sorted((name, (values,) if isinstance(values, str) else tuple(values))
+                                  for name, values in (filters or {}).items()))
+        key = (' '.join(query_text.split()), limit, self.model_type, filter_key, facets)
+        results = self.cache.get(key)
+        if results is not None:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+            return results
+        self.cache_misses += 1
+        results = self.run_search(query_text, limit, filters, facets)
+        self.cache[key] = results
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return results
 
-    def print_results(self, results):
+    def document(self, result):
+        # Campos almacenados del resultado; si el índice no guarda el contenido (perfil 'compact'),
+        # el resto de campos se obtiene bajo demanda del fichero original
+        fields = result.fields()
+        if 'content' not in fields and self.docs_folder:
+            fields = dict(parse_doc(self.docs_folder, fields['path']), **fields)
+        return fields
+
+    def snippet(self, result, top=2):
+        text = result.get('content')
+        if text is None:
+            text = self.document(result).get('content', '')
+        return self.highlighter.highlight_hit(result, 'content', text=text, top=top)
+
+    def cache_info(self):
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.cache),
+                'maxsize': self.cache_size, 'generation': self.cache_generation}
+
+    def search_page(self, query_text, pagenum=1, pagelen=10, filters=None, facets=False):
+        # Solo se puntúan los pagenum * pagelen primeros resultados (uno más para saber si hay otra página);
+        # los campos almacenados de cada resultado no se leen hasta que se muestra
+        if pagenum < 1:
+            raise ValueError('page must be >= 1')
+        results = self.search(query_text, limit=pagenum * pagelen + 1, filters=filters, facets=facets)
+        offset = (pagenum - 1) * pagelen
+        hits = results[offset:offset + pagelen]
+        has_next = results.scored_length() > offset + pagelen
+        return results, hits, has_next
+
+    def print_results(self, results, hits=None, start=1):
         print("Returned documents:")
-        for i, result in enumerate(results, start=1):
+        for i, result in enumerate(results if hits is None else hits, start=start):
             print(f'{i} - File path: {result.get("path")}, Similarity score: {result.score}')
             if self.info:
-                print(f'\t Modified : {result.get("modified")}')
-            ###
-            # if self.info:
-            # print(f'Modified : {result.get("modified")}')
-            # print(f'Title: {result.get("title")}')
-            # print(f'Author: {result.get("author")}')
-            # print(f'Director(s): {result.get("director")}')
-            # print(f'Department: {result.get("department")}')
-            # print(f'Description: {result.get("description")}')
-            # print(f'Subject: {result.get("subject")}')
-            # print(f'Date: {result.get("date")}')
-            # print(f'Type of work: {result.get("type_of_work")}')
-            ###
+                document = self.document(result)
+                print(f'\t Modified : {document.get("modified")}')
+                print(f'\t Title: {document.get("title")}')
+                print(f'\t Author: {document.get("author")}')
+                print(f'\t Director(s): {document.get("director")}')
+                print(f'\t Department: {document.get("department")}')
+                print(f'\t Description: {document.get("description")}')
+                print(f'\t Subject: {document.get("subject")}')
+                print(f'\t Date: {document.get("date")}')
+                print(f'\t Type of work: {document.get("type_of_work")}')
+            if self.snippets:
+                print(f'\t Snippet: {self.snippet(result)}')
+        for name, counts in self.facet_counts(results).items():
+            print(f'Facet {name}:')
+            for value, count in counts:
+                print(f'\t{value} ({count})')
+
+def percentile(values, p):
+    # Percentil por el método del rango más cercano sobre una lista ordenada
+    if not values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(values)) - 1, 0)
+    return values[rank]
+
+# Cada proceso del pool de búsqueda mantiene su propio MySearcher (y por tanto su propio lector del índice)
+batch_searcher = None
+
+def init_batch_searcher(index_folder, model_type, early_termination=False, config=None):
+    global batch_searcher
+    batch_searcher = MySearcher(index_folder, model_type=model_type, early_termination=early_termination, config=config)
+
+def run_batch_query(args):
+    qid, (query, query_filter), limit = args
+    start = time.perf_counter()
+    results = batch_searcher.search_query(query, query_filter, limit)
+    identifiers = [r.get('identifier') for r in results]
+    return qid, identifiers, time.perf_counter() - start
+
+def batch_search(index_folder, queries, output_file, procs=1, limit=100, model_type='tfidf', early_termination=False,
+                 config=None):
+    start = time.perf_counter()
+    init_batch_searcher(index_folder, model_type, early_termination, config)
+    # Cada consulta se analiza una única vez y se envía ya parseada a los procesos de búsqueda
+    tasks = [(qid, batch_searcher.parse(query), limit) for qid, query in enumerate(queries, start=1)]
+    if procs > 1:
+        with Pool(procs, initializer=init_batch_searcher, initargs=(index_folder, model_type, early_termination, config)) as pool:
+            answers = pool.map(run_batch_query, tasks)
+    else:
+        answers = [run_batch_query(task) for task in tasks]
+    # pool.map conserva el orden de las tareas, así que los resultados se escriben en orden de qid
+    with open(output_file, 'w') as f_out:
+        for qid, identifiers, _ in answers:
+            for identifier in identifiers:
+                f_out.write(f"{qid}\t{identifier}\n")
+    wall_time = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for _, _, latency in answers)
+    print(f'Queries: {len(queries)}, searchers: {procs}, total wall time: {wall_time:.3f} s')
+    print(f'Query latency (ms): p50 {percentile(latencies, 50):.2f}, p90 {percentile(latencies, 90):.2f}, '
+          f'p99 {percentile(latencies, 99):.2f}, max {percentile(latencies, 100):.2f}')
 
 if __name__ == '__main__':
     info = False
     index_folder = '../whooshindex'
     info_needs_file = None
     output_file = None
+    procs = 1
+    filters = {}
+    facets = False
+    docs_folder = None
+    topk = None
+    pagelen = 10
+    snippets = False
+    model_type = 'tfidf'
+    config_file = None
 
     i = 1
     while (i < len(sys.argv)):
@@ -77,21 +374,69 @@ if __name__ == '__main__':
             i = i + 1
         if sys.argv[i] == '-info':
             info = True
+        if sys.argv[i] == '-procs':
+            procs = int(sys.argv[i + 1])
+            i = i + 1
+        if sys.argv[i] == '-filter':
+            # -filter <department|type_of_work|date>=<valor>, se puede repetir
+            name, _, value = sys.argv[i + 1].partition('=')
+            if name not in FACET_FIELDS or not value:
+                print(f'Usage: -filter <{"|".join(FACET_FIELDS)}>=<value>')
+                exit(1)
+            filters.setdefault(name, []).append(value)
+            i = i + 1
+        if sys.argv[i] == '-facets':
+            facets = True
+        if sys.argv[i] == '-docs':
+            docs_folder = sys.argv[i + 1]
+            i = i + 1
+        if sys.argv[i] == '-topk':
+            # número de resultados a recuperar con terminación temprana (MaxScore)
+            topk = int(sys.argv[i + 1])
+            i = i + 1
+        if sys.argv[i] == '-pagelen':
+            pagelen = int(sys.argv[i + 1])
+            i = i + 1
+        if sys.argv[i] == '-snippets':
+            snippets = True
+        if sys.argv[i] == '-model':
+            # -model is expected to be either 'tfidf' or 'bm25'
+            model_type = sys.argv[i + 1]
+            i = i + 1
+        if sys.argv[i] == '-config':
+            config_file = sys.argv[i + 1]
+            i = i + 1
         i = i + 1
 
-    searcher = MySearcher(index_folder=index_folder, info=info)
-
+    config = load_config(config_file)
     if info_needs_file and output_file:
         with open(info_needs_file, 'r') as f:
             queries = [line.strip() for line in f if line.strip()]
-        with open(output_file, 'w') as f_out:
-            for qid, query in enumerate(queries, start=1):
-                results = searcher.search(query, limit=100)
-                for r in results:
-                    f_out.write(f"{qid}\t{r.get('identifier')}\n")
+        batch_search(index_folder, queries, output_file, procs=procs, limit=topk or 100, model_type=model_type,
+                     early_termination=topk is not None, config=config)
     else: 
+        searcher = MySearcher(index_folder=index_folder, model_type=model_type, info=info, docs_folder=docs_folder,
+                              early_termination=topk is not None, snippets=snippets, config=config)
+        # Los resultados se muestran por páginas: solo se calcula la página que se pide
+        last_query = None
+        has_next = False
         query = input("Introduce a query: ")
         while query != 'q':
-            results = searcher.search(query)
-            searcher.print_results(results)
-            query = input("Introduce a query ('q' for exit): ")
\ No newline at end of file
+            # 'n' solo pide la página siguiente si la hay; si no, se busca como cualquier otra consulta
+            if query == 'n' and has_next:
+                pagenum = pagenum + 1
+            else:
+                last_query = query
+                pagenum = 1
+            try:
+                results, hits, has_next = searcher.search_page(last_query, pagenum, pagelen, filters=filters, facets=facets)
+            except ValueError as error:
+                print(error)
+                has_next = False
+                query = input("Introduce a query ('q' for exit): ")
+                continue
+            searcher.print_results(results, hits, start=(pagenum - 1) * pagelen + 1)
+            if has_next:
+                query = input(f"Page {pagenum}. Introduce a query ('n' for next page, 'q' for exit): ")
+            else:
+                query = input("Introduce a query ('q' for exit): ")
\ No newline at end of file
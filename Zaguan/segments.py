@@ -0,0 +1,95 @@
+"""
+segments.py
+
+Program to report the segments of an index created with index.py (of every shard, for a sharded index): number of
+documents, deleted documents and size on disk of each segment, to decide when the index needs to be compacted.
+With -optimize the segments of each index (or shard) with more than -max-segments segments are merged into one, and
+with -every the check is repeated every given number of seconds, so it can run next to incremental loads that use
+index.py -merge none. If a writer holds the index lock, that index is skipped until the next check.
+Usage: python segments.py -index <index folder> [-optimize [-max-segments <number of segments>] [-every <seconds>]]
+"""
+
+import sys
+import time
+
+import whoosh.index as index
+from whoosh.index import LockError
+
+from index import shard_folders
+
+
+def index_folders(index_folder):
+    return shard_folders(index_folder) or [index_folder]
+
+
+def segment_info(ix):
+    storage = ix.storage
+    info = []
+    for segment in ix._segments():
+        size = sum(storage.file_length(name) for name in segment.list_files(storage))
+        info.append((segment.segment_id(), segment.doc_count_all(), segment.deleted_count(), size))
+    return info
+
+
+def report(index_folder):
+    total_segments = 0
+    total_size = 0
+    for folder in index_folders(index_folder):
+        ix = index.open_dir(folder)
+        info = segment_info(ix)
+        size = sum(segment[3] for segment in info)
+        print(f'{folder}: {len(info)} segments, {sum(segment[1] for segment in info)} documents, '
+              f'{size / 1024 / 1024:.2f} MB (generation {ix.latest_generation()})')
+        for segment_id, docs, deleted, segment_size in sorted(info, key=lambda segment: -segment[3]):
+            print(f'\t{segment_id}\t{docs} docs\t{deleted} deleted\t{segment_size / 1024:.1f} KB')
+        total_segments += len(info)
+        total_size += size
+        ix.close()
+    print(f'Total: {total_segments} segments, {total_size / 1024 / 1024:.2f} MB')
+
+
+def optimize(index_folder, max_segments=1):
+    for folder in index_folders(index_folder):
+        ix = index.open_dir(folder)
+        segments = len(ix._segments())
+        if segments > max_segments:
+            start = time.perf_counter()
+            try:
+                ix.optimize()
+                print(f'{folder}: {segments} segments merged in {time.perf_counter() - start:.2f} s')
+            except LockError:
+                print(f'{folder}: index locked by a writer, skipped')
+        ix.close()
+
+
+if __name__ == '__main__':
+    index_folder = '../whooshindex'
+    do_optimize = False
+    max_segments = 1
+    every = None
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-index':
+            index_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-optimize':
+            do_optimize = True
+        elif sys.argv[i] == '-max-segments':
+            max_segments = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-every':
+            every = float(sys.argv[i + 1])
+            i = i + 1
+        i = i + 1
+
+    if not index.exists_in(index_folder) and not shard_folders(index_folder):
+        print(f'No index found in {index_folder}')
+        exit(1)
+    report(index_folder)
+    if do_optimize:
+        while True:
+            optimize(index_folder, max_segments)
+            if every is None:
+                break
+            time.sleep(every)
+        report(index_folder)
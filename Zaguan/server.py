@@ -0,0 +1,163 @@
+"""
+server.py
+
+Long-lived local HTTP/JSON search server around MySearcher, so the index is not reopened per query.
+Queries are answered by a pool of threads, each one with its own warm MySearcher. The searchers are
+refreshed when a new generation of the index is committed on disk.
+Usage: python server.py -index <index folder> [-port <port>] [-workers <number of threads>] [-model <tfidf|bm25>]
+Query: GET http://localhost:<port>/search?q=<query>&limit=<number of results>[&page=<page number>][&department=<value>][&type_of_work=<value>][&date=<value>][&facets=1]
+"""
+
+import json
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from search import MySearcher, FACET_FIELDS
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/search':
+            self.send_json(404, {'error': 'Not found'})
+            return
+        params = parse_qs(url.query)
+        query_text = params.get('q', [''])[0]
+        try:
+            limit = int(params.get('limit', ['10'])[0])
+            pagenum = int(params.get('page', ['1'])[0])
+        except ValueError:
+            self.send_json(400, {'error': 'limit and page must be integers'})
+            return
+        if limit < 1:
+            self.send_json(400, {'error': 'limit must be >= 1'})
+            return
+        if pagenum < 1:
+            self.send_json(400, {'error': 'page must be >= 1'})
+            return
+
+        filters = {name: params[name] for name in FACET_FIELDS if name in params}
+        facets = params.get('facets', ['0'])[0] == '1'
+
+        searcher = self.server.get_searcher()
+        start = time.perf_counter()
+        # limit es el tamaño de página: solo se calculan los resultados hasta la página pedida
+        try:
+            results, page, has_next = searcher.search_page(query_text, pagenum, limit, filters=filters, facets=facets)
+        except ValueError as error:
+            self.send_json(400, {'error': str(error)})
+            return
+        hits = [{'path': r.get('path'), 'identifier': r.get('identifier'), 'title': r.get('title'), 'score': r.score}
+                for r in page]
+        body = {
+            'query': query_text,
+            'total': len(results),
+            'page': pagenum,
+            'has_next': has_next,
+            'generation': searcher.generation(),
+            'time_ms': (time.perf_counter() - start) * 1000,
+            'results': hits
+        }
+        if facets:
+            body['facets'] = {name: dict(counts) for name, counts in searcher.facet_counts(results).items()}
+        self.send_json(200, body)
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class SearchServer(HTTPServer):
+    def __init__(self, address, index_folder, model_type='tfidf', workers=4, check_interval=1.0, verbose=False):
+        super().__init__(address, SearchHandler)
+        self.index_folder = index_folder
+        self.model_type = model_type
+        self.check_interval = check_interval
+        self.verbose = verbose
+        # Cada hilo del pool tiene su propio MySearcher (y su propio lector del índice)
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # Se abren los lectores de todos los hilos antes de atender la primera consulta
+        barrier = threading.Barrier(workers)
+        warmup = [self.pool.submit(self.warm_up, barrier) for _ in range(workers)]
+        for future in warmup:
+            future.result()
+
+    def warm_up(self, barrier):
+        self.get_searcher()
+        barrier.wait()
+
+    def get_searcher(self):
+        searcher = getattr(self.local, 'searcher', None)
+        now = time.monotonic()
+        if searcher is None:
+            searcher = self.local.searcher = MySearcher(self.index_folder, model_type=self.model_type)
+            self.local.checked = now
+        elif now - self.local.checked > self.check_interval:
+            # Como mucho una comprobación por intervalo de si hay una nueva generación del índice en disco
+            if searcher.refresh() and self.verbose:
+                print(f'{threading.current_thread().name}: index reloaded')
+            self.local.checked = now
+        return searcher
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+
+if __name__ == '__main__':
+    index_folder = '../whooshindex'
+    port = 8000
+    workers = 4
+    model_type = 'tfidf'
+    verbose = False
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-index':
+            index_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-port':
+            port = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-workers':
+            workers = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-model':
+            model_type = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-verbose':
+            verbose = True
+        i = i + 1
+
+    server = SearchServer(('localhost', port), index_folder, model_type=model_type, workers=workers, verbose=verbose)
+    print(f'Serving {index_folder} on http://localhost:{port}/search?q=<query> with {workers} threads')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,48 @@
+"""
+spanish_analysis.py
+
+Spanish analyzer shared by index.py and search.py.
+The analyzer is pickled into the index schema, so its filters live in this module (and not in a
+script run as __main__) to let search.py load them back when it opens the index.
+"""
+
+from functools import lru_cache
+
+from whoosh.analysis import RegexTokenizer, LowercaseFilter, StopFilter, Filter
+from nltk.stem.snowball import SnowballStemmer
+
+
+class SnowballFilter(Filter):
+    # Por la ley de Zipf unos pocos miles de formas cubren la mayoría de los tokens,
+    # así que se memoriza la raíz de cada forma en una caché LRU acotada
+    def __init__(self, language='spanish', cachesize=50000):
+        self.language = language
+        self.cachesize = cachesize
+        self._create_stemmer()
+
+    def _create_stemmer(self):
+        self.stemmer = SnowballStemmer(self.language)
+        self.stem = lru_cache(maxsize=self.cachesize)(self.stemmer.stem)
+
+    def __getstate__(self):
+        # La caché no se guarda con el esquema del índice
+        return {'language': self.language, 'cachesize': self.cachesize}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._create_stemmer()
+
+    def cache_info(self):
+        return self.stem.cache_info()
+
+    def clear_cache(self):
+        self.stem.cache_clear()
+
+    def __call__(self, tokens):
+        stem = self.stem
+        for t in tokens:
+            t.text = stem(t.text)
+            yield t
+
+
+spanish_analyzer = RegexTokenizer() | LowercaseFilter() | StopFilter(lang="es") | SnowballFilter('spanish')
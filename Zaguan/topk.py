@@ -0,0 +1,120 @@
+"""
+topk.py
+
+Top-k retrieval with early termination (MaxScore) for the OR queries built by MySearcher.
+Only queries whose OR clauses are all terms are scored this way; any other query (NOT, phrases, prefixes...) falls
+back to the exhaustive Searcher.search.
+The query is split into its OR clauses, and each clause keeps an upper bound of its score (max_quality of its
+matcher). Clauses are sorted by that bound; once k documents have been collected, the clauses whose summed bounds
+cannot beat the k-th score become "non-essential": they are only used to complete the score of documents found by
+the other clauses, and their remaining postings are skipped. The scores are the same as Searcher.search(limit=k);
+only documents with tied scores may be ordered differently, since the clause scores are added in another order.
+"""
+
+import heapq
+import time
+
+from whoosh.query import Or, Term
+from whoosh.searching import Results
+
+
+def or_clauses(query):
+    # Aplana los Or anidados (sin boost) que genera MultifieldParser con OrGroup
+    if isinstance(query, Or) and query.boost == 1.0:
+        clauses = []
+        for subquery in query.subqueries:
+            clauses.extend(or_clauses(subquery))
+        return clauses
+    return [query]
+
+
+class TopKResults(Results):
+    # El número total de coincidencias no se conoce al terminar antes de tiempo; se calcula solo si se pide
+    def __init__(self, searcher, q, top_n, query_filter=None, runtime=0):
+        super().__init__(searcher, q, top_n, runtime=runtime)
+        self.query_filter = query_filter
+
+    def __len__(self):
+        if self._total is None:
+            docs = set(self.searcher.docs_for_query(self.q))
+            if self.query_filter is not None:
+                docs &= set(self.searcher.docs_for_query(self.query_filter))
+            self._total = len(docs)
+        return self._total
+
+    def scored_length(self):
+        return len(self.top_n)
+
+
+def max_score_search(searcher, query, limit, query_filter=None):
+    start_time = time.perf_counter()
+    allowed = None
+    if query_filter is not None:
+        allowed = set(searcher.docs_for_query(query_filter))
+    clauses = or_clauses(query)
+    # La cota max_quality solo vale para los términos: un NOT (InverseMatcher) declara 0 pero suma 1 a cada documento,
+    # y las frases o los prefijos no tienen cota. Con cualquier otra cláusula se puntúa de forma exhaustiva
+    if not all(isinstance(clause, Term) for clause in clauses):
+        return searcher.search(query, limit=limit, filter=query_filter)
+    # Montículo de mínimos con los k mejores (puntuación, -docnum): ante empate whoosh prefiere el docnum menor
+    heap = []
+
+    for subsearcher, offset in searcher.leaf_searchers():
+        context = subsearcher.context()
+        matchers = [clause.matcher(subsearcher, context) for clause in clauses]
+        matchers = [m for m in matchers if m.is_active()]
+        if not all(m.supports_block_quality() for m in matchers):
+            return searcher.search(query, limit=limit, filter=query_filter)
+        matchers.sort(key=lambda m: m.max_quality())
+        # bounds[i]: máxima puntuación que puede aportar un documento que solo aparezca en las cláusulas 0..i
+        bounds = []
+        total = 0.0
+        for m in matchers:
+            total += m.max_quality()
+            bounds.append(total)
+
+        first_essential = 0
+        if len(heap) == limit:
+            while first_essential < len(matchers) and bounds[first_essential] <= heap[0][0]:
+                first_essential += 1
+
+        while first_essential < len(matchers):
+            essential = [m for m in matchers[first_essential:] if m.is_active()]
+            if not essential:
+                break
+            docnum = min(m.id() for m in essential)
+            if allowed is not None and docnum + offset not in allowed:
+                for m in essential:
+                    if m.id() == docnum:
+                        m.next()
+                continue
+
+            score = 0.0
+            for m in essential:
+                if m.id() == docnum:
+                    score += m.score()
+                    m.next()
+            # Las cláusulas no esenciales se consultan de mayor a menor cota mientras el documento pueda entrar
+            full = len(heap) == limit
+            for i in range(first_essential - 1, -1, -1):
+                if full and score + bounds[i] <= heap[0][0]:
+                    break
+                m = matchers[i]
+                if m.is_active() and m.id() < docnum:
+                    m.skip_to(docnum)
+                if m.is_active() and m.id() == docnum:
+                    score += m.score()
+
+            item = (score, -(docnum + offset))
+            if not full:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+            else:
+                continue
+            if len(heap) == limit:
+                while first_essential < len(matchers) and bounds[first_essential] <= heap[0][0]:
+                    first_essential += 1
+
+    top_n = [(score, -negdocnum) for score, negdocnum in sorted(heap, reverse=True)]
+    return TopKResults(searcher, query, top_n, query_filter=query_filter, runtime=time.perf_counter() - start_time)
@@ -0,0 +1,110 @@
+"""
+benchmark_bm25.py
+
+Benchmark of the two ranking models of search.py on the same documents: tf-idf (cosine over the SparseMatrixSimilarity
+of an index built with -model tfidf) and Okapi BM25 (dot product of the query with the BM25 document vectors of an
+index built with -model okapi). It reports the load time and the query latency of each one and, with a qrels file,
+their P@k and MAP; without it, the overlap of their top k results.
+The qrels file contains one judgement per line: qid<TAB>file path<TAB>relevance (relevance > 0 means relevant),
+where qid is the line number of the query in the queries file.
+Usage: python benchmark_bm25.py -tfidf <tfidf index folder> -okapi <okapi index folder> -queries <queries file>
+       [-qrels <qrels file>] [-k <cutoff>] [-language <english|spanish>]
+"""
+
+import sys
+import time
+
+import index
+import search
+
+
+def read_qrels(qrels_file):
+    qrels = {}
+    with open(qrels_file, 'r') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) >= 3 and int(parts[2]) > 0:
+                qrels.setdefault(int(parts[0]), set()).add(parts[1])
+    return qrels
+
+
+def precision_at(ranking, relevant, k):
+    return sum(1 for file_path in ranking[:k] if file_path in relevant) / k
+
+
+def average_precision(ranking, relevant):
+    hits = 0
+    total = 0.0
+    for position, file_path in enumerate(ranking, start=1):
+        if file_path in relevant:
+            hits += 1
+            total += hits / position
+    return total / len(relevant) if relevant else 0.0
+
+
+def run(index_folder, queries, limit=100):
+    searcher = search.MySearcher(index_folder)
+    rankings = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        results = searcher.search(query, limit)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rankings.append([file_path for file_path, _ in results])
+    return searcher.load_time, sorted(latencies), rankings
+
+
+def benchmark(index_folders, queries, qrels=None, k=10):
+    runs = {name: run(folder, queries) for name, folder in index_folders.items()}
+    header = 'model\tload ms\tp50 ms\tp99 ms'
+    if qrels:
+        header += f'\tP@{k}\tMAP'
+    print(header)
+    for name, (load_time, latencies, rankings) in runs.items():
+        line = (f'{name}\t{load_time * 1000:.1f}\t{search.percentile(latencies, 50):.2f}'
+                f'\t{search.percentile(latencies, 99):.2f}')
+        if qrels:
+            judged = [(ranking, qrels[qid]) for qid, ranking in enumerate(rankings, start=1) if qid in qrels]
+            line += (f'\t{sum(precision_at(r, relevant, k) for r, relevant in judged) / max(len(judged), 1):.4f}'
+                     f'\t{sum(average_precision(r, relevant) for r, relevant in judged) / max(len(judged), 1):.4f}')
+        print(line)
+    if not qrels and len(runs) == 2:
+        (_, _, first), (_, _, second) = runs.values()
+        overlap = sum(len(set(a[:k]) & set(b[:k])) / k for a, b in zip(first, second)) / max(len(queries), 1)
+        print(f'Mean overlap of the top {k} results: {overlap:.2%}')
+
+
+if __name__ == '__main__':
+    index_folders = {}
+    queries_file = None
+    qrels_file = None
+    k = 10
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-tfidf':
+            index_folders['tfidf'] = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-okapi':
+            index_folders['okapi'] = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-queries':
+            queries_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-qrels':
+            qrels_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-k':
+            k = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-language':
+            # -language is expected to be either 'english' or 'spanish'
+            index.LANGUAGE = sys.argv[i + 1]
+            i = i + 1
+        i = i + 1
+
+    if queries_file is None or not index_folders:
+        print('Usage: python benchmark_bm25.py -tfidf <tfidf index folder> -okapi <okapi index folder> -queries <queries file>')
+        exit(1)
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    benchmark(index_folders, queries, read_qrels(qrels_file) if qrels_file else None, k)
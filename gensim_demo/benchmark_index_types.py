@@ -0,0 +1,108 @@
+"""
+benchmark_index_types.py
+
+Benchmark of the two kinds of similarity index of index.py: SparseMatrixSimilarity (-index-type sparse), which keeps
+the whole term-document matrix in memory, and the sharded Similarity (-index-type sharded), whose shards are stored
+in separate files and memory-mapped when queried. For each one it reports the build time, the query latency and the
+peak RSS of building the index and of loading it and answering the queries. Every build and every query run is done
+in a new process, so that the RSS of one does not count in the other.
+Usage: python benchmark_index_types.py -docs <docs folder> -index <work folder> -queries <queries file>
+       [-shard-size <documents per shard>] [-language <english|spanish>]
+"""
+
+import contextlib
+import io
+import os
+import resource
+import sys
+import time
+
+from multiprocessing import Process, Queue
+
+from gensim import corpora
+from gensim import models
+
+import index
+import search
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build(index_folder, docs_folder, index_type, shard_size, language, results):
+    index.LANGUAGE = language
+    start = time.perf_counter()
+    # create_index prints the whole dictionary
+    with contextlib.redirect_stdout(io.StringIO()):
+        index.create_index(index_folder, docs_folder, index_type=index_type, shard_size=shard_size)
+    results.put((time.perf_counter() - start, peak_rss_mb()))
+
+
+def run_queries(index_folder, queries, language, results):
+    index.LANGUAGE = language
+    start = time.perf_counter()
+    dictionary = corpora.Dictionary.load(index.get_dictionary_file_name(index_folder))
+    model = models.TfidfModel.load(index.get_model_file_name(index_folder))
+    index_matrix = search.load_index(index_folder)
+    load_time = time.perf_counter() - start
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index_matrix[model[dictionary.doc2bow(index.generate_terms(query))]]
+        latencies.append((time.perf_counter() - start) * 1000)
+    results.put((load_time, sorted(latencies), peak_rss_mb()))
+
+
+def in_process(target, *args):
+    results = Queue()
+    process = Process(target=target, args=args + (results,))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def benchmark(docs_folder, work_folder, queries, shard_size, language):
+    index.create_folder(work_folder)
+    print('index\tbuild s\tbuild RSS MB\tload ms\tp50 ms\tp99 ms\tquery RSS MB')
+    for index_type in ['sparse', 'sharded']:
+        index_folder = os.path.join(work_folder, index_type)
+        build_time, build_rss = in_process(build, index_folder, docs_folder, index_type, shard_size, language)
+        load_time, latencies, query_rss = in_process(run_queries, index_folder, queries, language)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+        print(f'{index_type}\t{build_time:.2f}\t{build_rss:.1f}\t{load_time * 1000:.1f}\t{p50:.2f}\t{p99:.2f}\t{query_rss:.1f}')
+
+
+if __name__ == '__main__':
+    docs_folder = '../docs'
+    work_folder = '../gensimbenchmark'
+    queries_file = None
+    shard_size = 32768
+    language = index.LANGUAGE
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == '-docs':
+            docs_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-index':
+            work_folder = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-queries':
+            queries_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-shard-size':
+            shard_size = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-language':
+            language = sys.argv[i + 1]
+            i = i + 1
+        i = i + 1
+
+    if queries_file is None:
+        print('A queries file is required (-queries <queries file>)')
+        exit(1)
+    with open(queries_file, 'r') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    benchmark(docs_folder, work_folder, queries, shard_size, language)
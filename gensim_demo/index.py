@@ -5,9 +5,21 @@ Last update: 2024-09-07
 
 Program to create an inverted index (term-document sparse matrix) with either a vector model (tf-idf) or OkapiBM25 model.
 This program is based on the gensim Python library. See https://github.com/RaRe-Technologies/gensim/#documentation .
-Usage: python index.py -docs <doc folder> -index <index folder> -language <english|spanish>
+Usage: python index.py -docs <doc folder> -index <index folder> -language <english|spanish> [-model <tfidf|okapi>]
+       [-index-type <sparse|sharded>] [-shard-size <documents per shard>] [-procs <number of processes>]
+       python index.py -docs <doc folder> -index <index folder> -language <english|spanish> -append [-refresh-idf]
+The documents are tokenized (in -procs processes) into a token cache in the index folder, which is read by the
+dictionary and the bag-of-words passes and reused by later builds while the documents and the language do not change.
+With -index-type sharded the similarity index is a gensim Similarity: the documents are split into shards of -shard-size
+documents stored as separate files, which are memory-mapped when queried instead of loading the whole matrix.
+With -append only the documents of the docs folder that are not in the index yet are processed: the dictionary is
+extended, their vectors are added to the similarity index and their paths to paths.json, and their tokens are merged
+into the token cache. They are weighted with the IDF of the existing model until -refresh-idf, which builds the
+dictionary, the model and the index again from the token cache, as a full build of the same documents would.
 """
 
+import heapq
+import itertools
 import os
 import pprint
 import sys
@@ -16,15 +28,26 @@ import xml.etree.ElementTree as ET
 from gensim import corpora
 from gensim import models
 from gensim import similarities
+from gensim import matutils
+from gensim import utils
 from nltk.stem.snowball import SnowballStemmer
 
 import json
+import scipy.sparse
+from functools import lru_cache, partial
+from multiprocessing import Pool
 
 LANGUAGE = 'english'
 #LANGUAGE = 'spanish'
 
 STOP_LIST = None
 
+# Punctuation replaced by spaces before splitting the text into words
+PUNCTUATION = ",;:.-/\\(){}[]¿?¡!\"#&'+*%$_"
+PUNCTUATION_TABLE = str.maketrans(PUNCTUATION, ' ' * len(PUNCTUATION))
+
+TOKENIZER = None
+
 def create_folder(folder_name):
     if (not os.path.exists(folder_name)):
         os.mkdir(folder_name)
@@ -44,25 +67,21 @@ def get_index_file_name(folder_name):
     create_folder(folder_name)
     return os.path.join(folder_name, 'index')
 
-def get_paths_file_name(folder_name):
+def get_corpus_file_name(folder_name):
     create_folder(folder_name)
-    return os.path.join(folder_name, 'paths.json')
+    return os.path.join(folder_name, 'corpus.mm')
 
-def apply_stemming(words):
-    # the stemmer requires a language parameter
-    snow_stemmer = SnowballStemmer(language=LANGUAGE)
-
-    # stem's of each word
-    stem_words = []
-    for w in words:
-        x = snow_stemmer.stem(w)
-        stem_words.append(x)
+def get_weighted_corpus_file_name(folder_name):
+    create_folder(folder_name)
+    return os.path.join(folder_name, 'weighted_corpus.mm')
 
-    # print stemming results
-    #for e1, e2 in zip(words, stem_words):
-    #    print(e1 + ' ----> ' + e2)
+def get_tokens_file_name(folder_name):
+    create_folder(folder_name)
+    return os.path.join(folder_name, 'tokens.jsonl')
 
-    return stem_words
+def get_paths_file_name(folder_name):
+    create_folder(folder_name)
+    return os.path.join(folder_name, 'paths.json')
 
 def get_stop_list():
     global STOP_LIST
@@ -75,46 +94,103 @@ def get_stop_list():
             STOP_LIST = set('por para un una unos unas de del el la lo los las y a al en'.split(' '))
         return STOP_LIST
 
-def generate_terms(text, stemming=True):
-    stoplist = get_stop_list()
+class Tokenizer:
+    # Turns a text into index terms: punctuation removal, lower case, stop words and stemming.
+    # It is created once and reused for every document and query: the translation table is precompiled,
+    # there is a single stemmer, and the stems of the most recent cache_size distinct words are memoized
+    # (the same word forms repeat across documents)
+    def __init__(self, language, stemming=True, cache_size=100000):
+        self.language = language
+        self.stoplist = get_stop_list()
+        self.stemming = stemming
+        # the stemmer requires a language parameter
+        self.stemmer = SnowballStemmer(language=language)
+        self.stem = lru_cache(maxsize=cache_size)(self.stemmer.stem)
+
+    def normalize(self, text):
+        return text.translate(PUNCTUATION_TABLE)
+
+    def terms(self, text):
+        words = [word for word in self.normalize(text).lower().split() if word not in self.stoplist]
+        if self.stemming:
+            stem = self.stem
+            words = [stem(word) for word in words]
+        return words
+
+    def cache_info(self):
+        return self.stem.cache_info()
+
+def get_tokenizer():
+    global TOKENIZER
+    if TOKENIZER is None or TOKENIZER.language != LANGUAGE:
+        TOKENIZER = Tokenizer(LANGUAGE)
+    return TOKENIZER
 
-    word_vector = [word for word in text.lower().split() if word not in stoplist]
+def apply_stemming(words):
+    # stem's of each word
+    stem = get_tokenizer().stem
+    return [stem(w) for w in words]
 
+def generate_terms(text, stemming=True):
     if stemming:
-        #apply stemming
-        word_vector = apply_stemming(word_vector)
-
-    return word_vector
+        return get_tokenizer().terms(text)
+    stoplist = get_stop_list()
+    return [word for word in normalize(text).lower().split() if word not in stoplist]
 
 def normalize(word):
-    x = ",;:.-/\\(){}[]¿?¡!\"#&'+*%$_"
-    y = "                          "
-    table = str.maketrans(x, y)
-    return word.translate(table).strip()
+    return word.translate(PUNCTUATION_TABLE).strip()
 
-def process_text_file(foldername, filename):
+def read_text_file(foldername, filename):
     file_path = os.path.join(foldername, filename)
-    # print(file_path)
     with open(file_path) as fp:
-        text = ' '.join(normalize(line) for line in fp if line)
+        return fp.read()
+
+def read_xml_file(foldername, filename):
+    file_path = os.path.join(foldername, filename)
+    tree = ET.parse(file_path)
+    root = tree.getroot()
+    return "".join(root.itertext())
+
+def process_text_file(foldername, filename):
+    # print(file_path)
+    text = normalize(read_text_file(foldername, filename))
     # print(text)
     return text
 
 
 def process_xml_file(foldername, filename):
-    file_path = os.path.join(foldername, filename)
-    # print(file_path)
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    raw_text = "".join(root.itertext())
-    # print(raw_text)
-    # break into lines and remove leading and trailing space on each
-    lines = (line.strip() for line in raw_text.splitlines())
-    # remove punctuation
-    text = ' '.join(normalize(chunk) for line in lines for chunk in line.split())
+    # remove punctuation (the words are separated by any whitespace later)
+    text = normalize(read_xml_file(foldername, filename))
     # print(text)
     return text
 
+def list_docs(docs_folder):
+    return [file for file in sorted(os.listdir(docs_folder)) if file.endswith('.xml') or file.endswith('.txt')]
+
+def init_worker(language):
+    # The processes of the pool use the language of the parent process
+    global LANGUAGE
+    LANGUAGE = language
+
+def tokenize_file(foldername, filename):
+    if filename.endswith('.xml'):
+        return get_tokenizer().terms(read_xml_file(foldername, filename))
+    return get_tokenizer().terms(read_text_file(foldername, filename))
+
+def tokenize_files(docs_folder, files, procs=1):
+    if procs > 1:
+        # imap returns the documents in order
+        with Pool(procs, initializer=init_worker, initargs=(LANGUAGE,)) as pool:
+            yield from pool.imap(partial(tokenize_file, docs_folder), files, chunksize=16)
+    else:
+        for file in files:
+            yield tokenize_file(docs_folder, file)
+
+def docs_signature(docs_folder, files):
+    # The token cache is valid while the language and the name, size and modification time of every file are the same
+    stats = [os.stat(os.path.join(docs_folder, file)) for file in files]
+    return {'language': LANGUAGE, 'files': [[file, stat.st_size, stat.st_mtime_ns] for file, stat in zip(files, stats)]}
+
 def store_filepahts(docs_folder, index_folder):
     filepaths = []
     for file in sorted(os.listdir(docs_folder)):
@@ -126,20 +202,172 @@ def store_filepahts(docs_folder, index_folder):
         json.dump(filepaths, f)
 
 class MyCorpus:
-    def __init__(self, folder_name):
+    def __init__(self, folder_name, tokenizer=None):
         self.folder_name = folder_name
+        self.tokenizer = tokenizer
 
     def __iter__(self):
+        tokenizer = self.tokenizer or get_tokenizer()
         for file in sorted(os.listdir(self.folder_name)):
             # print(file)
             if file.endswith('.xml'):
-                text = process_xml_file(self.folder_name, file)
-                yield generate_terms(text)
+                yield tokenizer.terms(read_xml_file(self.folder_name, file))
             elif file.endswith('.txt'):
-                text = process_text_file(self.folder_name, file)
-                yield generate_terms(text)
+                yield tokenizer.terms(read_text_file(self.folder_name, file))
 
 
+def load_similarity_index(index_folder, mmap=None):
+    # The index is either a SparseMatrixSimilarity or a sharded Similarity (-index-type sharded)
+    index_file_name = get_index_file_name(index_folder)
+    index = utils.SaveLoad.load(index_file_name, mmap=mmap)
+    if isinstance(index, similarities.Similarity):
+        # The shards are memory-mapped on the first query, from the folder where the index is now
+        index.output_prefix = index_file_name
+        index.check_moved()
+    return index
+
+def append_to_mm(file_name, vectors):
+    # A Matrix Market file cannot be extended in place (its header has the number of documents and non-zeros),
+    # so the stored vectors are streamed together with the new ones into a new file
+    corpora.MmCorpus.serialize(file_name + '.tmp', itertools.chain(corpora.MmCorpus(file_name), vectors))
+    os.replace(file_name + '.tmp', file_name)
+    os.replace(file_name + '.tmp.index', file_name + '.index')
+
+def append_documents(index_folder, docs_folder, refresh_idf=False, procs=1):
+    # Adds to an existing index the documents of docs_folder that are not in paths.json yet, without
+    # processing the indexed ones again. The model is not retrained unless refresh_idf is set
+    with open(get_paths_file_name(index_folder), 'r') as f:
+        file_paths = json.load(f)
+    indexed = set(file_paths)
+    new_files = [file for file in list_docs(docs_folder) if file not in indexed]
+    print('New documents: ', len(new_files))
+    new_docs = list(tokenize_files(docs_folder, new_files, procs)) if new_files else []
+    tokens = append_tokens(index_folder, docs_folder, file_paths, new_files, new_docs)
+
+    model = utils.SaveLoad.load(get_model_file_name(index_folder))
+    index = load_similarity_index(index_folder)
+    model_type = 'okapi' if isinstance(model, models.OkapiBM25Model) else 'tfidf'
+    index_type = 'sharded' if isinstance(index, similarities.Similarity) else 'sparse'
+    if refresh_idf:
+        if tokens is None:
+            tokens = tokenize_indexed_files(index_folder, docs_folder, file_paths + new_files, procs)
+        refresh_model(index_folder, tokens, model_type, index_type,
+                      index.shardsize if index_type == 'sharded' else 32768)
+        return
+    if not new_files:
+        return
+
+    dictionary = corpora.Dictionary.load(get_dictionary_file_name(index_folder))
+    # New terms get new ids and the document frequencies of all the terms are updated
+    dictionary.add_documents(new_docs)
+    dictionary.save(get_dictionary_file_name(index_folder))
+    new_bows = [dictionary.doc2bow(terms) for terms in new_docs]
+    append_to_mm(get_corpus_file_name(index_folder), new_bows)
+    file_paths.extend(new_files)
+    with open(get_paths_file_name(index_folder), 'w') as f:
+        json.dump(file_paths, f)
+
+    # Until the model is refreshed, the new documents are weighted with its statistics and the terms
+    # it does not know (new terms) are left out of their vectors
+    new_vectors = [model[[(termid, tf) for termid, tf in bow if termid in model.idfs]] for bow in new_bows]
+    append_to_mm(get_weighted_corpus_file_name(index_folder), new_vectors)
+    if index_type == 'sharded':
+        # Fills the last shard and opens new ones as needed
+        index.add_documents(new_vectors)
+    else:
+        if model_type == 'tfidf':
+            new_vectors = [matutils.unitvec(vector) for vector in new_vectors]
+        rows = matutils.corpus2csc(new_vectors, num_terms=index.index.shape[1], dtype=index.index.dtype).T
+        index.index = scipy.sparse.vstack([index.index, rows]).tocsr()
+    index.save(get_index_file_name(index_folder))
+
+def append_tokens(index_folder, docs_folder, file_paths, new_files, new_docs):
+    # Merges the tokens of the new documents into the token cache, which stays in the order of the file names as in
+    # a full build. Returns None (and leaves the cache as it is) if the cache does not hold the indexed documents
+    tokens_file_name = get_tokens_file_name(index_folder)
+    if not os.path.exists(tokens_file_name):
+        return None
+    with open(tokens_file_name, encoding='utf-8') as f:
+        signature = json.loads(f.readline())
+        if signature['language'] != LANGUAGE or [entry[0] for entry in signature['files']] != sorted(file_paths):
+            return None
+        if not new_files:
+            return TokenCorpus(tokens_file_name)
+        new_entries = docs_signature(docs_folder, new_files)['files']
+        merged = {'language': LANGUAGE, 'files': sorted(signature['files'] + new_entries, key=lambda entry: entry[0])}
+        # Both streams are sorted by file name, so the indexed documents are copied one line at a time
+        old = ((entry[0], json.loads(line)) for entry, line in zip(signature['files'], f))
+        new = zip(new_files, new_docs)
+        docs = (terms for _, terms in heapq.merge(old, new, key=lambda doc: doc[0]))
+        return write_token_cache(tokens_file_name, merged, docs)
+
+def tokenize_indexed_files(index_folder, docs_folder, file_paths, procs=1):
+    # Token cache of the indexed documents when the stored one does not match them (e.g. an index appended
+    # to before the cache was kept up to date). Their files must still be in the docs folder
+    files = sorted(file_paths)
+    missing = [file for file in files if not os.path.exists(os.path.join(docs_folder, file))]
+    if missing:
+        print(f'{len(missing)} indexed documents are not in {docs_folder} (e.g. {missing[0]}), rebuild the index')
+        exit(1)
+    print(f'Tokenizing {len(files)} indexed documents with {procs} processes')
+    return write_token_cache(get_tokens_file_name(index_folder), docs_signature(docs_folder, files),
+                             tokenize_files(docs_folder, files, procs))
+
+def refresh_model(index_folder, tokens, model_type='tfidf', index_type='sparse', shard_size=32768):
+    # Everything is computed again from the token cache as in a full build of the same documents: the dictionary
+    # (dictionary.add_documents keeps the terms seen in a single document, and the terms filtered out in the first
+    # build are missing from the vectors of the older documents), the bag-of-words vectors, the model and the index
+    print('Refreshing the model statistics')
+    dictionary = create_dictionary(tokens)
+    dictionary.save(get_dictionary_file_name(index_folder))
+    corpus_file_name = get_corpus_file_name(index_folder)
+    corpora.MmCorpus.serialize(corpus_file_name, (dictionary.doc2bow(terms) for terms in tokens))
+    model = train_model(model_type, dictionary)
+    model.save(get_model_file_name(index_folder))
+    build_similarity_index(index_folder, model, corpora.MmCorpus(corpus_file_name), len(dictionary), model_type,
+                           index_type, shard_size)
+    # The documents are now in the order of the token cache
+    with open(get_paths_file_name(index_folder), 'w') as f:
+        json.dump(tokens.files(), f)
+
+class TokenCorpus:
+    # Token stream cached on disk: a header line with the signature of the documents and then
+    # the terms of each document as a JSON list per line, in the order of the file paths
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def __iter__(self):
+        with open(self.file_name, encoding='utf-8') as f:
+            next(f)
+            for line in f:
+                yield json.loads(line)
+
+    def files(self):
+        with open(self.file_name, encoding='utf-8') as f:
+            return [entry[0] for entry in json.loads(f.readline())['files']]
+
+def write_token_cache(tokens_file_name, signature, docs):
+    # The cache is written to a temporary file and renamed at the end, so an interrupted run leaves no partial cache
+    with open(tokens_file_name + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(signature) + '\n')
+        for terms in docs:
+            f.write(json.dumps(terms, ensure_ascii=False) + '\n')
+    os.replace(tokens_file_name + '.tmp', tokens_file_name)
+    return TokenCorpus(tokens_file_name)
+
+def preprocess_corpus(index_folder, docs_folder, procs=1):
+    files = list_docs(docs_folder)
+    signature = docs_signature(docs_folder, files)
+    tokens_file_name = get_tokens_file_name(index_folder)
+    if os.path.exists(tokens_file_name):
+        with open(tokens_file_name, encoding='utf-8') as f:
+            if json.loads(f.readline()) == signature:
+                print('Reusing cached tokens: ', tokens_file_name)
+                return TokenCorpus(tokens_file_name)
+
+    print(f'Tokenizing {len(files)} documents with {procs} processes')
+    return write_token_cache(tokens_file_name, signature, tokenize_files(docs_folder, files, procs))
+
 def create_dictionary(processed_corpus, compact=True):
     dictionary = corpora.Dictionary(processed_corpus)
 
@@ -152,8 +380,51 @@ def create_dictionary(processed_corpus, compact=True):
     # print(dictionary)
     return dictionary
 
-def create_index(index_folder, docs_folder, model_type='tfidf'):
-    processed_corpus = MyCorpus(docs_folder)
+def train_model(model_type, dictionary):
+    # Both models only need the statistics gathered by the dictionary (number of documents, document frequencies and,
+    # for BM25, collection frequencies), so they are trained without another pass over the corpus, and in the same
+    # way when the index is created and when it is refreshed after -append
+    if model_type == 'tfidf':
+        # In case of TfIdf, the “training” consists simply of computing document frequencies of all its features
+        return models.TfidfModel(dictionary=dictionary, smartirs='lfc')
+    elif model_type == 'okapi':
+        # Trained from a corpus, gensim would average the number of distinct terms per document instead of the
+        # number of tokens that it uses as the length of each document when weighting it
+        return models.OkapiBM25Model(dictionary=dictionary)
+    else:
+        print('Model type not recognized')
+        exit(1)
+
+def build_similarity_index(index_folder, model, bow_corpus, length, model_type='tfidf', index_type='sparse', shard_size=32768):
+    # If the size of the corpus is big, the Similarity class should be used (see https://radimrehurek.com/gensim/similarities/docsim.html )
+    # The weighted vectors are also serialized, so that the index knows the number of documents and non-zero
+    # values beforehand and fills the sparse matrix directly (without intermediate lists)
+    weighted_corpus_file_name = get_weighted_corpus_file_name(index_folder)
+    corpora.MmCorpus.serialize(weighted_corpus_file_name, model[bow_corpus])
+    index_file_name = get_index_file_name(index_folder)
+    if index_type == 'sparse' and model_type == 'okapi':
+        # BM25 scores are the dot product of the BM25-weighted documents and the query, without cosine normalization
+        # (see MySearcher in search.py for the query vectors)
+        index = similarities.SparseMatrixSimilarity(corpora.MmCorpus(weighted_corpus_file_name), num_features=length,
+                                                    normalize_queries=False, normalize_documents=False)
+    elif index_type == 'sparse':
+        index = similarities.SparseMatrixSimilarity(corpora.MmCorpus(weighted_corpus_file_name), num_features=length)
+    elif index_type == 'sharded':
+        # Only the documents of the shard being filled are kept in memory; each full shard is stored
+        # in the file index.<shard number> of the index folder
+        index = similarities.Similarity(index_file_name, corpora.MmCorpus(weighted_corpus_file_name),
+                                        num_features=length, shardsize=shard_size)
+    else:
+        print('Index type not recognized')
+        exit(1)
+    index.save(index_file_name)
+
+def create_index(index_folder, docs_folder, model_type='tfidf', index_type='sparse', shard_size=32768, procs=1):
+    if model_type == 'okapi' and index_type != 'sparse':
+        # The shards of Similarity always normalize the document vectors, which would turn BM25 into a cosine
+        print('The okapi model requires -index-type sparse')
+        exit(1)
+    processed_corpus = preprocess_corpus(index_folder, docs_folder, procs)
     # for vector in processed_corpus:  # load one vector into memory at a time
     #    print(vector)
 
@@ -173,18 +444,14 @@ def create_index(index_folder, docs_folder, model_type='tfidf'):
     new_vec = dictionary.doc2bow(new_doc_words)
     print('Example document as bow vector: ', new_vec)
 
-    bow_corpus = [dictionary.doc2bow(text) for text in processed_corpus]
-    # pprint.pprint(bow_corpus)
+    # The bag-of-words vectors are streamed to a Matrix Market file instead of being kept in a list:
+    # the model and the index read them back one document at a time
+    corpus_file_name = get_corpus_file_name(index_folder)
+    corpora.MmCorpus.serialize(corpus_file_name, (dictionary.doc2bow(text) for text in processed_corpus))
+    bow_corpus = corpora.MmCorpus(corpus_file_name)
 
     # train the model
-    if model_type == 'tfidf':
-        model = models.TfidfModel(bow_corpus, smartirs='lfc')
-        # In case of TfIdf, the “training” consists simply of going through the supplied corpus once and computing document frequencies of all its features
-    elif model_type == 'okapi':
-        model = models.OkapiBM25Model(bow_corpus)
-    else:
-        print('Model type not recognized')
-        exit(1)
+    model = train_model(model_type, dictionary)
     # 'model' is an object that facilitate transformations between two specific vector spaces.
     # 'model' is a wrapper around the corpus document stream: actual conversions are done on-the-fly, during document iteration
     # We need to store the 'model' to allow the transformation of queries during the searching process
@@ -195,10 +462,7 @@ def create_index(index_folder, docs_folder, model_type='tfidf'):
     print('Example document as tfidf vector ',model[new_vec])
 
     # We create and store the inverted index (term-document sparse matrix), which will be used later to compute the similarities with a query
-    # If the size of the corpus is big, the Similarity class should be used (see https://radimrehurek.com/gensim/similarities/docsim.html )
-    index = similarities.SparseMatrixSimilarity(model[bow_corpus], num_features=length)
-    index_file_name = get_index_file_name(index_folder)
-    index.save(index_file_name)
+    build_similarity_index(index_folder, model, bow_corpus, length, model_type, index_type, shard_size)
 
     #We need to store also the file paths to show meaningful results during search
     store_filepahts(docs_folder, index_folder)
@@ -208,6 +472,12 @@ if __name__ == '__main__':
 
     index_folder = '../gensimindex'
     docs_folder = '../docs'
+    model_type = 'tfidf'
+    index_type = 'sparse'
+    shard_size = 32768
+    procs = 1
+    append = False
+    refresh_idf = False
     i = 1
     while i < len(sys.argv):
         if sys.argv[i] == '-index':
@@ -220,6 +490,28 @@ if __name__ == '__main__':
             # -language is expected to be either 'english' or 'spanish'
             LANGUAGE = sys.argv[i + 1]
             i = i + 1
+        elif sys.argv[i] == '-index-type':
+            # -index-type is expected to be either 'sparse' or 'sharded'
+            index_type = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-shard-size':
+            shard_size = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-model':
+            # -model is expected to be either 'tfidf' or 'okapi'
+            model_type = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-procs':
+            procs = int(sys.argv[i + 1])
+            i = i + 1
+        elif sys.argv[i] == '-append':
+            append = True
+        elif sys.argv[i] == '-refresh-idf':
+            refresh_idf = True
         i = i + 1
 
-    create_index(index_folder, docs_folder)
\ No newline at end of file
+    if append or refresh_idf:
+        append_documents(index_folder, docs_folder, refresh_idf=refresh_idf, procs=procs)
+        exit(0)
+    create_index(index_folder, docs_folder, model_type=model_type, index_type=index_type, shard_size=shard_size,
+                 procs=procs)
\ No newline at end of file
@@ -5,46 +5,136 @@ Last update: 2024-09-07
 
 Program to search a free text query on a previously created inverted index with either a vector model (tf-idf) or OkapiBM25 model
 This program is based on the gensim Python library. See https://github.com/RaRe-Technologies/gensim/#documentation .
-Usage: python search.py -index <index folder> -language <english|spanish>
+Usage: python search.py -index <index folder> -language <english|spanish> [-infoNeeds <queries file> -output <results file>] [-verbose]
+       [-query-weights <binary|tf>]
+With an index built with -model okapi the documents are ranked by BM25: the query vector only has the binary (or raw
+tf, with -query-weights tf) weight of its terms and the score is its dot product with the BM25 document vectors.
+The index is loaded once (memory-mapped) and then queries are read interactively until 'q', or taken from a queries
+file (one per line) writing qid<TAB>file path lines to the results file. The load time is reported apart from the
+latency of the queries.
 """
 
 from gensim import corpora
 from gensim import models
-from gensim import similarities
+from gensim import utils
 
 import index
 import sys
 import json
+import math
+import time
 
-def search(index_folder, query):
-    dictionary = corpora.Dictionary.load(index.get_dictionary_file_name(index_folder))
+import numpy
 
-    query_document = index.generate_terms(query)
-    print('query words: ', query_document)
-    query_bow = dictionary.doc2bow(query_document)
-    print('query bow: ', query_bow)
+def load_index(index_folder):
+    return index.load_similarity_index(index_folder, mmap='r')
 
-    index_matrix = similarities.MatrixSimilarity.load(index.get_index_file_name(index_folder))
-    model = models.TfidfModel.load(index.get_model_file_name(index_folder))
+class MySearcher:
+    # Loads the dictionary, the model, the index and the file paths once, to answer any number of queries
+    def __init__(self, index_folder, verbose=False, query_weights='binary'):
+        start = time.perf_counter()
+        self.dictionary = corpora.Dictionary.load(index.get_dictionary_file_name(index_folder))
+        # The same tokenizer as the documents (and its stem memo) is used for every query
+        self.tokenizer = index.get_tokenizer()
+        # The model is either a TfidfModel or an OkapiBM25Model (index.py -model okapi)
+        self.model = utils.SaveLoad.load(index.get_model_file_name(index_folder), mmap='r')
+        if isinstance(self.model, models.OkapiBM25Model):
+            # The BM25 saturation and length normalization are already in the document vectors, so the query
+            # vector is not transformed by the model: it is binary ('bnn') or keeps the raw term frequencies ('nnn')
+            self.query_model = models.TfidfModel(dictionary=self.dictionary,
+                                                 smartirs='bnn' if query_weights == 'binary' else 'nnn')
+        else:
+            self.query_model = self.model
+        self.index_matrix = load_index(index_folder)
+        # Load the file_paths to display meaningful results
+        with open(index.get_paths_file_name(index_folder), 'r') as f:
+            self.file_paths = json.load(f)
+        self.load_time = time.perf_counter() - start
+        self.verbose = verbose
 
-    print('query tfidf vector: ',model[query_bow])
-    sims = index_matrix[model[query_bow]]
+    def query_vector(self, query):
+        query_document = self.tokenizer.terms(query)
+        # Terms added with index.py -append are not in the model (nor in the index) until the IDF is refreshed
+        query_bow = [(termid, tf) for termid, tf in self.dictionary.doc2bow(query_document) if termid in self.model.idfs]
+        query_vector = self.query_model[query_bow]
+        if self.verbose:
+            print('query words: ', query_document)
+            print('query bow: ', query_bow)
+            print('query vector: ', query_vector)
+        return query_vector
 
-    print('Returned documents:')
+    def rank(self, query_vectors, limit=100):
+        # A single query vector gives 1-D arrays of ids and scores; a list of query vectors is scored
+        # against the index in one matrix product and gives one row per query
+        return top_k(self.index_matrix[query_vectors], limit)
 
-    # Load the file_paths to display meaningful results
-    with open(index.get_paths_file_name(index_folder), 'r') as f:
-        file_paths = json.load(f)
+    def results(self, ids, scores):
+        # Documents with similarity 0 do not contain any query term
+        return [(self.file_paths[document_number], score) for document_number, score in zip(ids, scores) if score > 0.0]
 
-    i = 1
-    for document_number, score in sorted(enumerate(sims), key=lambda x: x[1], reverse=True):
-        if score == 0.0 or i > 100:
-            break
-        print(f'{i} - File path: {file_paths[document_number]}, Similarity score: {score}')
-        i += 1
+    def search(self, query, limit=100):
+        ids, scores = self.rank(self.query_vector(query), limit)
+        return self.results(ids, scores)
+
+    def search_many(self, queries, limit=100):
+        ids, scores = self.rank([self.query_vector(query) for query in queries], limit)
+        return [self.results(query_ids, query_scores) for query_ids, query_scores in zip(ids, scores)]
+
+    def print_results(self, results):
+        print('Returned documents:')
+        for i, (file_path, score) in enumerate(results, start=1):
+            print(f'{i} - File path: {file_path}, Similarity score: {score}')
+
+def top_k(sims, k):
+    # Top k of a vector of similarities (one query) or of each row of a matrix (one row per query), without sorting
+    # all the documents: argpartition finds the k-th best score in linear time and only the k winners are sorted.
+    # Returns the document ids and their scores, ordered by decreasing score and, on ties, by document id
+    # (the same order as sorting all the documents)
+    sims = numpy.asarray(sims)
+    if sims.ndim > 1:
+        ranked = [top_k(row, k) for row in sims]
+        return numpy.array([ids for ids, _ in ranked]), numpy.array([scores for _, scores in ranked])
+    k = min(k, len(sims))
+    if k <= 0:
+        return numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=sims.dtype)
+    threshold = sims[numpy.argpartition(sims, len(sims) - k)[len(sims) - k]]
+    # Documents tied with the k-th score are taken by increasing id
+    above = numpy.flatnonzero(sims > threshold)
+    ties = numpy.flatnonzero(sims == threshold)[:k - len(above)]
+    ids = numpy.concatenate((above, ties))
+    ids = ids[numpy.argsort(-sims[ids], kind='stable')]
+    return ids, sims[ids]
+
+def search(index_folder, query):
+    searcher = MySearcher(index_folder, verbose=True)
+    searcher.print_results(searcher.search(query))
+
+def percentile(values, p):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return 0.0
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+def batch_search(searcher, queries, output_file, limit=100):
+    latencies = []
+    with open(output_file, 'w') as f_out:
+        for qid, query in enumerate(queries, start=1):
+            start = time.perf_counter()
+            results = searcher.search(query, limit)
+            latencies.append((time.perf_counter() - start) * 1000)
+            for file_path, _ in results:
+                f_out.write(f'{qid}\t{file_path}\n')
+    latencies.sort()
+    print(f'Queries: {len(queries)}, total query time: {sum(latencies):.1f} ms')
+    print(f'Query latency (ms): p50 {percentile(latencies, 50):.2f}, p90 {percentile(latencies, 90):.2f}, '
+          f'p99 {percentile(latencies, 99):.2f}, max {latencies[-1] if latencies else 0.0:.2f}')
 
 if __name__ == '__main__':
     index_folder = '../gensimindex'
+    info_needs_file = None
+    output_file = None
+    verbose = False
+    query_weights = 'binary'
     i = 1
     while (i < len(sys.argv)):
         if sys.argv[i] == '-index':
@@ -54,8 +144,36 @@ if __name__ == '__main__':
             # -language is expected to be either 'english' or 'spanish'
             index.LANGUAGE = sys.argv[i + 1]
             i = i + 1
+        elif sys.argv[i] == '-infoNeeds':
+            info_needs_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-output':
+            output_file = sys.argv[i + 1]
+            i = i + 1
+        elif sys.argv[i] == '-verbose':
+            verbose = True
+        elif sys.argv[i] == '-query-weights':
+            # -query-weights is expected to be either 'binary' or 'tf'
+            query_weights = sys.argv[i + 1]
+            i = i + 1
         i = i + 1
 
-    #query = 'system engineering'
-    query = input('Introduce a query: ')
-    search(index_folder, query)
\ No newline at end of file
+    searcher = MySearcher(index_folder, verbose=verbose, query_weights=query_weights)
+    print(f'Index loaded in {searcher.load_time * 1000:.1f} ms')
+    if info_needs_file:
+        if output_file is None:
+            print('An output file is required in batch mode (-output <results file>)')
+            exit(1)
+        with open(info_needs_file, 'r') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        batch_search(searcher, queries, output_file)
+    else:
+        #query = 'system engineering'
+        query = input('Introduce a query: ')
+        while query != 'q':
+            start = time.perf_counter()
+            results = searcher.search(query)
+            elapsed = time.perf_counter() - start
+            searcher.print_results(results)
+            print(f'Query time: {elapsed * 1000:.2f} ms')
+            query = input("Introduce a query ('q' for exit): ")